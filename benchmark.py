@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+""" Benchmarks for calculate.py on synthetic Senate data.
+
+Writes a synthetic senate.gov roll call archive (menu.xml and one xml file per
+vote, for years starting in 1989) and legislator yaml files into a scratch
+directory, then times parsing, saving, loading, calculate_betrayal and the
+histograms over the first 1, 10 and 50 simulated years. Results are written
+as JSON so that runs of different versions can be compared with --compare.
+"""
+from argparse import ArgumentParser
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from xml.sax.saxutils import escape
+
+import yaml
+
+import calculate
+
+FIRST_YEAR = 1989
+SEATS = 100
+STATES = ('AK', 'AL', 'AR', 'AZ', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA', 'HI', 'IA', 'ID', 'IL', 'IN', 'KS', 'KY',
+          'LA', 'MA', 'MD', 'ME', 'MI', 'MN', 'MO', 'MS', 'MT', 'NC', 'ND', 'NE', 'NH', 'NJ', 'NM', 'NV', 'NY',
+          'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VA', 'VT', 'WA', 'WI', 'WV', 'WY')
+PARTY_NAMES = {'D': 'Democrat', 'R': 'Republican', 'I': 'Independent'}
+""" How often roll calls need each majority, as a rough match of recent sessions. """
+REQUIREMENTS = ('1/2',) * 7 + ('3/5',) * 2 + ('2/3',)
+""" Resolutions voted with Guilty / Not Guilty rather than Yea / Nay. """
+VERDICT_RESOLUTIONS = ('Guilty', 'Not Guilty')
+
+def generate_senate(root, years, votes_per_year, seed = 0):
+    """ Writes synthetic data for the years into root/data, laid out the way
+    calculate.py downloads it. Each year has votes_per_year roll calls of 100
+    members. Senators mostly vote with their party, a few seats change hands
+    every year, and the result of each roll call follows from its votes and its
+    majority_requirement, with a resolution drawn from SUCCESS_WORDS or FAIL_WORDS. """
+    rnd = random.Random(seed)
+    legislators = []
+    def new_senator(state, party):
+        lis = 'S{:03d}'.format(len(legislators) + 1)
+        legislators.append({'id': {'lis': lis},
+                            'name': {'first': 'First{}'.format(lis), 'last': 'Last{}'.format(lis)},
+                            'terms': [{'party': PARTY_NAMES[party], 'state': state}],
+                            'loyalty': rnd.uniform(0.8, 0.99)})
+        return legislators[-1]
+    seats = [new_senator(STATES[seat // 2], rnd.choice('DR') if seat % 40 else 'I') for seat in xrange(SEATS)]
+
+    regular_resolutions = {
+        'Y': [word for word in calculate.SUCCESS_WORDS if word not in VERDICT_RESOLUTIONS],
+        'N': [word for word in calculate.FAIL_WORDS if word not in VERDICT_RESOLUTIONS],
+    }
+    for year in years:
+        for seat in rnd.sample(xrange(SEATS), 3):
+            state = seats[seat]['terms'][-1]['state']
+            seats[seat] = new_senator(state, rnd.choice('DR'))
+        congress, session = calculate.calculate_session(year)
+        year_path = os.path.join(root, 'data', 'rollcalls', str(year))
+        os.makedirs(year_path)
+        menu_votes = []
+        for vote_number in xrange(1, votes_per_year + 1):
+            vote_number = '{:05d}'.format(vote_number)
+            verdict = rnd.random() < 0.01
+            requires = verdict and '2/3' or rnd.choice(REQUIREMENTS)
+            positions = dict((party, rnd.random() < 0.5) for party in PARTY_NAMES)
+            members = []
+            counts = {'Y': 0, 'N': 0}
+            for senator in seats:
+                party = senator['terms'][-1]['party'][0]
+                draw = rnd.random()
+                if draw < 0.03:
+                    vote_cast = draw < 0.005 and 'Present' or 'Not Voting'
+                else:
+                    answer = positions[party] == (rnd.random() < senator['loyalty']) and 'Y' or 'N'
+                    counts[answer] += 1
+                    vote_cast = {'Y': verdict and 'Guilty' or 'Yea', 'N': verdict and 'Not Guilty' or 'Nay'}[answer]
+                members.append((senator, party, vote_cast))
+            success = counts['Y'] >= calculate.necessary_yeas(counts['N'], requires) and 'Y' or 'N'
+            if verdict:
+                resolution = success == 'Y' and 'Guilty' or 'Not Guilty'
+            else:
+                resolution = rnd.choice(regular_resolutions[success])
+            with open(os.path.join(year_path, '{}.xml'.format(vote_number)), 'wb') as f:
+                f.write(roll_call_xml(congress, session, year, vote_number, requires, resolution, counts, members))
+            menu_votes.append('<vote><vote_number>{}</vote_number><vote_date>01-Jan</vote_date>'
+                              '<issue>S. {}</issue><question>On the Motion</question><result>{}</result>'
+                              '<vote_tally><yeas>{}</yeas><nays>{}</nays></vote_tally>'
+                              '<title>Synthetic vote &amp; title</title></vote>'.format(
+                                  vote_number, vote_number, escape(resolution), counts['Y'], counts['N']))
+        with open(os.path.join(year_path, 'menu.xml'), 'wb') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<vote_summary><congress>{}</congress>'
+                    '<session>{}</session><congress_year>{}</congress_year><votes>{}</votes>'
+                    '</vote_summary>'.format(congress, session, year, ''.join(menu_votes)))
+
+    legislators_path = os.path.join(root, 'data', 'legislators')
+    os.makedirs(legislators_path)
+    current = set(senator['id']['lis'] for senator in seats)
+    for filename, is_current in (('legislators-current.yaml', True), ('legislators-historical.yaml', False)):
+        with open(os.path.join(legislators_path, filename), 'wb') as f:
+            yaml.safe_dump([dict((key, value) for key, value in senator.items() if key != 'loyalty')
+                            for senator in legislators if (senator['id']['lis'] in current) == is_current], f)
+
+def roll_call_xml(congress, session, year, vote_number, requires, resolution, counts, members):
+    """ A roll call vote file in the format of senate.gov. """
+    member_xml = ''.join(
+        '<member><member_full>{last} ({party}-{state})</member_full><last_name>{last}</last_name>'
+        '<first_name>{first}</first_name><party>{party}</party><state>{state}</state>'
+        '<vote_cast>{vote_cast}</vote_cast><lis_member_id>{lis}</lis_member_id></member>'.format(
+            last=senator['name']['last'], first=senator['name']['first'], party=party,
+            state=senator['terms'][-1]['state'], vote_cast=vote_cast, lis=senator['id']['lis'])
+        for senator, party, vote_cast in members)
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<roll_call_vote>'
+            '<congress>{congress}</congress><session>{session}</session><congress_year>{year}</congress_year>'
+            '<vote_number>{vote_number}</vote_number><vote_date>January 1, {year},  12:00 PM</vote_date>'
+            '<modify_date>January 1, {year},  12:30 PM</modify_date>'
+            '<vote_question_text>On the Motion (Synthetic &amp; Motion)</vote_question_text>'
+            '<vote_document_text>A synthetic document</vote_document_text>'
+            '<vote_result_text>{resolution} ({yeas}-{nays})</vote_result_text><question>On the Motion</question>'
+            '<vote_title>Synthetic &amp; Motion</vote_title><majority_requirement>{requires}</majority_requirement>'
+            '<vote_result>{resolution}</vote_result>'
+            '<document><document_congress>{congress}</document_congress><document_type>S.</document_type>'
+            '<document_number>{vote_number}</document_number><document_name>S. {vote_number}</document_name>'
+            '<document_title>A synthetic bill</document_title><document_short_title /></document>'
+            '<amendment><amendment_number /><amendment_to_amendment_number /></amendment>'
+            '<count><yeas>{yeas}</yeas><nays>{nays}</nays><present /><absent /></count>'
+            '<tie_breaker><by_whom /><tie_breaker_vote /></tie_breaker>'
+            '<members>{members}</members></roll_call_vote>').format(
+                congress=congress, session=session, year=year, vote_number=vote_number,
+                resolution=escape(resolution), yeas=counts['Y'], nays=counts['N'], requires=requires,
+                members=member_xml)
+
+class Silence(object):
+    """ Sends stdout to os.devnull for the reports being timed. """
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+    def __exit__(self, *exc_info):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+def timed(timings, stage, function, repeat = 1):
+    """ Runs function repeat times, records the fastest wall time under stage and returns its last result. """
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        with Silence():
+            result = function()
+        elapsed = time.time() - start
+        best = best is None and elapsed or min(best, elapsed)
+    timings[stage] = best
+    return result
+
+def benchmark(years, parsers, repeat):
+    """ Times each stage over years, in the current directory. """
+    timings = {}
+    for parser in parsers:
+        paths = [path for year in years for path in calculate.roll_call_paths(year)]
+        roll_calls = timed(timings, 'parse_{}'.format(parser),
+                           lambda: [calculate.parse_roll_call_file((path, parser)) for path in paths])
+    def save():
+        for year in years:
+            paths = calculate.roll_call_paths(year)
+            calculate.save_roll_calls(year, [calculate.parse_roll_call_file((path, parsers[0])) for path in paths],
+                                      [calculate.vote_number_from_path(path) for path in paths])
+    timed(timings, 'parse_and_save', save)
+    roll_calls = timed(timings, 'pickle_load',
+                       lambda: [roll_call for year in years for roll_call in calculate.load_roll_calls(year)], repeat)
+    timed(timings, 'senator_registry', lambda: calculate.SenatorRegistry.load(), repeat)
+
+    vm = calculate.RollCallManager(years)
+    vm.roll_calls = roll_calls
+    engines = ['objects', 'cached']
+    if calculate.numpy is not None:
+        timed(timings, 'columns_load', lambda: [vm.load_columns(year) for year in years])
+        engines.append('vectorized')
+    for engine in engines:
+        for only_necessary in (False, True):
+            timed(timings, 'calculate_betrayal_{}{}'.format(engine, only_necessary and '_necessary' or ''),
+                  lambda: calculate.calculate_betrayal(vm, only_necessary, limit=0, engine=engine), repeat)
+    timed(timings, 'resolution_hist', lambda: calculate.resolution_hist(vm), repeat)
+    timed(timings, 'betrayal_hist', lambda: calculate.betrayal_hist(vm), repeat)
+    return {
+        'years': len(years),
+        'roll_calls': len(roll_calls),
+        'votes': sum(len(roll_call.votes) for roll_call in roll_calls),
+        'timings': timings,
+    }
+
+def compare(results, previous_results, tolerance):
+    """ Prints every stage that is more than tolerance slower than in previous_results
+    and returns whether there were none. """
+    previous = dict((result['years'], result['timings']) for result in previous_results['results'])
+    regressions = 0
+    for result in results['results']:
+        for stage, seconds in sorted(result['timings'].items()):
+            before = previous.get(result['years'], {}).get(stage)
+            if before and seconds > before * (1 + tolerance):
+                regressions += 1
+                print '{} years, {}: {:.3f}s, was {:.3f}s'.format(result['years'], stage, seconds, before)
+    return regressions == 0
+
+def run(args):
+    parsers = args.parsers.split(',')
+    scales = sorted(int(scale) for scale in args.scales.split(','))
+    years = range(FIRST_YEAR, FIRST_YEAR + scales[-1])
+    original_path = os.getcwd()
+    work_path = tempfile.mkdtemp(prefix='senate-benchmark-')
+    results = {
+        'python': platform.python_version(),
+        'numpy': calculate.numpy is not None and calculate.numpy.__version__ or None,
+        'votes_per_year': args.votes_per_year,
+        'seed': args.seed,
+        'results': [],
+    }
+    try:
+        start = time.time()
+        generate_senate(work_path, years, args.votes_per_year, args.seed)
+        results['generate_seconds'] = time.time() - start
+        os.chdir(work_path)
+        calculate.load_senators(False)
+        for scale in scales:
+            results['results'].append(benchmark(years[:scale], parsers, args.repeat))
+            print >> sys.stderr, 'benchmarked {} years'.format(scale)
+    finally:
+        os.chdir(original_path)
+        if args.keep:
+            print >> sys.stderr, 'synthetic data kept in {}'.format(work_path)
+        else:
+            shutil.rmtree(work_path)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(output)
+    else:
+        print output
+    if args.compare:
+        with open(args.compare, 'rb') as f:
+            if not compare(results, json.load(f), args.tolerance):
+                sys.exit(1)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Time calculate.py on synthetic Senate roll calls')
+    parser.add_argument('--scales', type=str, default='1,10,50', help='csv of numbers of simulated years to time')
+    parser.add_argument('--votes-per-year', type=int, default=300, help='roll calls in each simulated year')
+    parser.add_argument('--parsers', type=str, default='stream,dom', help='csv of calculate.PARSERS to time')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each fast stage; the fastest is reported')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--output', type=str, help='file to write the JSON results to instead of stdout')
+    parser.add_argument('--compare', type=str, help='JSON results of an earlier run; exit with 1 if any stage got slower')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='fraction a stage may slow down by before --compare reports it')
+    parser.add_argument('--keep', action='store_true', help='keep the synthetic data directory')
+    args = parser.parse_args()
+    run(args)
@@ -1,26 +1,78 @@
 #!/usr/bin/env python
 from argparse import ArgumentParser
-from collections import Counter, defaultdict
+import BaseHTTPServer
+import cProfile
+import csv
+from collections import Counter, defaultdict, deque, namedtuple
+from contextlib import contextmanager
+from datetime import date
 import distutils.spawn
+import hashlib
+import httplib
+import itertools
 import json
+import marshal
+import multiprocessing
 import os
 try:
    import cPickle as pickle
 except:
    import pickle
+import Queue
+import re
+import resource
+import shutil
+import SocketServer
+import socket
+import sqlite3
+import struct
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 from time import sleep
-import urllib2
+import urlparse
 from xml.dom.minidom import parse
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
 
 # requires pyyaml
 import yaml
 
+# numpy is only needed for the columnar roll call store
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 LEGISLATORS_PICKLE = 'legislators.pickle'
+LEGISLATORS_REGISTRY = 'legislators.registry'
 ROLL_CALLS_PICKLE = 'roll_calls.pickle'
+ROLL_CALL_COLUMNS = 'columns'
+AGGREGATES_PICKLE = 'aggregates.pickle'
+SENATOR_INDEX = 'senators.index'
+MANIFEST = 'manifest.json'
+CLASSIFICATION = 'classification.json'
+""" Version of the RollCall objects and files kept in the store of a year; a store
+written by another version is rebuilt by the rebuild action. """
+STORE_VERSION = 4
+SEGMENT_PICKLE = 'roll_calls.{}.pickle'
+SEGMENT_COLUMNS = 'columns.{}'
+SEGMENT_NAME = re.compile(r'^(roll_calls\.\d+\.pickle|columns\.\d+)$')
 VERDICTS = { 'Yea': 'Y', 'Nay': 'N', 'Guilty': 'Y', 'Not Guilty': 'N' }
 
+SENATE_URL = 'https://www.senate.gov'
+""" Most roll call files waiting between two steps of load_years_pipelined. """
+PIPELINE_DEPTH = 64
+MENU_URL = '{base}/legislative/LIS/roll_call_lists/vote_menu_{session}_{subsession}.xml'
+VOTE_URL = '{base}/legislative/LIS/roll_call_votes/vote{session}{subsession}/vote_{session}_{subsession}_{vote_number}.xml'
+LEGISLATORS_URL = 'https://raw.githubusercontent.com/unitedstates/congress-legislators/master'
+LEGISLATORS_CURRENT_URL = '{base}/legislators-current.yaml'
+LEGISLATORS_HISTORICAL_URL = '{base}/legislators-historical.yaml'
+
 """ Current presidential candidates who were senators."""
 CANDIDATE_IDS = (
     'S313', # Bernie Sanders
@@ -92,66 +144,250 @@ FAIL_WORDS = (
     'Veto Sustained',
 )
 
-def load_senators(download):
+""" Callables subscribed to the stages of the pipeline. Each is called with the
+StageTiming of every Stage that completes while it is subscribed. """
+STAGE_HOOKS = []
+
+StageTiming = namedtuple('StageTiming', ('stage', 'year', 'wall', 'cpu', 'peak_memory', 'count'))
+
+class Stage(object):
+    """ Times a stage of the pipeline (for a year, where relevant) for the STAGE_HOOKS:
+
+    with Stage('parse', year) as stage:
+        roll_calls = ...
+        stage.count = len(roll_calls)
+
+    wall and cpu are in seconds, cpu being the user and system time of this process
+    only (not of parsing workers), and peak_memory is the largest resident size of the
+    process so far, in kilobytes. Nothing is measured when there are no hooks.
+    """
+    __slots__ = ('stage', 'year', 'count', 'started')
+
+    def __init__(self, stage, year = None):
+        self.stage = stage
+        self.year = year
+        self.count = None
+        self.started = None
+
+    def __enter__(self):
+        if STAGE_HOOKS:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            self.started = (time.time(), usage.ru_utime + usage.ru_stime)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.started is None or exc_type is not None:
+            return
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        timing = StageTiming(self.stage, self.year, time.time() - self.started[0],
+                             usage.ru_utime + usage.ru_stime - self.started[1], usage.ru_maxrss, self.count)
+        for hook in list(STAGE_HOOKS):
+            hook(timing)
+
+class StageTimings(object):
+    """ A stage hook that keeps every StageTiming, for the --timings report. """
+    def __init__(self):
+        self.timings = []
+
+    def __call__(self, timing):
+        self.timings.append(timing)
+
+    def report(self, out = sys.stderr):
+        print >> out, 'Stage                 Year    Wall s     CPU s  Peak MB      Count'
+        totals = defaultdict(lambda: [0, 0.0, 0.0, 0])
+        for timing in self.timings:
+            print >> out, '{:<20} {:>5} {:>9.3f} {:>9.3f} {:>8.1f} {:>10}'.format(
+                timing.stage, timing.year or '', timing.wall, timing.cpu, timing.peak_memory / 1024.0,
+                '' if timing.count is None else timing.count)
+            total = totals[timing.stage]
+            total[0] += 1
+            total[1] += timing.wall
+            total[2] += timing.cpu
+            total[3] += timing.count or 0
+        for stage, (stages, wall, cpu, count) in sorted(totals.items()):
+            if stages > 1:
+                print >> out, '{:<20} {:>5} {:>9.3f} {:>9.3f} {:>8} {:>10}'.format(stage, 'total', wall, cpu, '', count)
+
+def load_senators(download, fetcher = None):
     """ Builds new pickled senator data
 
     First, it downloads the data from github
     Second, it builds senators
     Third, it pickles them all in data/legislators/senators.pickle
+    Fourth, it saves them as the senator registry in data/legislators/legislators.registry,
+    and records the yaml files they were built from in data/legislators/manifest.json
 
     Parameters:
     download: try to download legislator data
+    fetcher: Fetcher used to download; a default one if None
     """
     if not os.path.isdir('data/legislators'):
         os.makedirs('data/legislators')
 
+    current_path = 'data/legislators/legislators-current.yaml'
+    historical_path = 'data/legislators/legislators-historical.yaml'
     if download:
-        current_path = 'data/legislators/legislators-current.yaml'
-        with open(current_path, 'wb') as f:
-            for l in urllib2.urlopen('https://raw.githubusercontent.com/unitedstates/congress-legislators/master/legislators-current.yaml'):
-                f.write(l)
-
-        historical_path = 'data/legislators/legislators-historical.yaml'
-        with open(historical_path, 'wb') as f:
-            for l in urllib2.urlopen('https://github.com/unitedstates/congress-legislators/blob/master/legislators-historical.yaml?raw=true'):
-                f.write(l)
-
-    success = True
-    senators = {}
-    if os.path.exists(current_path):
-        with open('data/legislators/legislators-current.yaml', 'rb') as f:
-            senator_list = yaml.safe_load(f)
-            for data in senator_list:
-                try:
-                    s = Senator(data, True)
-                    senators[s.lis] = s
-                except KeyError:
-                    pass
-    else:
-        print 'No file at data/legislators/legislators-current.yaml. Please download from https://www.govtrack.us/data/congress-legislators/legislators-current.yaml'
-        success = False
+        fetcher = fetcher or Fetcher()
+        with Stage('download-senators') as stage:
+            fetcher.fetch_all([(LEGISLATORS_CURRENT_URL.format(base=fetcher.legislators_url), current_path),
+                               (LEGISLATORS_HISTORICAL_URL.format(base=fetcher.legislators_url), historical_path)],
+                              conditional=True)
+            stage.count = 2
 
-    if os.path.exists(historical_path):
-        with open('data/legislators/legislators-historical.yaml', 'rb') as f:
-            senator_list = yaml.safe_load(f)
-            for data in senator_list:
-                try:
-                    s = Senator(data, False)
-                    if s.lis in senators:
-                        print "Data integrity issue: {} ({}) is in both current and historical records. Please update both legislators files".format(s.name, s.lis)
-                        sys.exit(1)
-                    senators[s.lis] = s
-                except KeyError:
-                    pass
-    else:
-        print 'No file at data/legislators/legislators-historical.yaml. Please download from https://www.govtrack.us/data/congress-legislators/legislators-historical.yaml'
-        success = False
+    with Stage('build-senators') as stage:
+        success = True
+        senators = {}
+        if os.path.exists(current_path):
+            with open('data/legislators/legislators-current.yaml', 'rb') as f:
+                senator_list = yaml.load(f, Loader=YAML_LOADER)
+                for data in senator_list:
+                    try:
+                        s = Senator(data, True)
+                        senators[s.lis] = s
+                    except KeyError:
+                        pass
+        else:
+            print 'No file at data/legislators/legislators-current.yaml. Please download from https://www.govtrack.us/data/congress-legislators/legislators-current.yaml'
+            success = False
 
-    if not success:
-        sys.exit(1)
+        if os.path.exists(historical_path):
+            with open('data/legislators/legislators-historical.yaml', 'rb') as f:
+                senator_list = yaml.load(f, Loader=YAML_LOADER)
+                for data in senator_list:
+                    try:
+                        s = Senator(data, False)
+                        if s.lis in senators:
+                            print "Data integrity issue: {} ({}) is in both current and historical records. Please update both legislators files".format(s.name, s.lis)
+                            sys.exit(1)
+                        senators[s.lis] = s
+                    except KeyError:
+                        pass
+        else:
+            print 'No file at data/legislators/legislators-historical.yaml. Please download from https://www.govtrack.us/data/congress-legislators/legislators-historical.yaml'
+            success = False
 
-    with open("data/legislators/{}".format(LEGISLATORS_PICKLE), 'wb') as f:
-        pickle.dump(senators, f)
+        if not success:
+            sys.exit(1)
+
+        with open("data/legislators/{}".format(LEGISLATORS_PICKLE), 'wb') as f:
+            pickle.dump(senators, f)
+        SenatorRegistry.save(senators.values())
+        with atomic_open("data/legislators/{}".format(MANIFEST)) as f:
+            json.dump({'files': dict((os.path.basename(path), file_record(path)) for path in (current_path, historical_path))},
+                      f, indent=0, sort_keys=True)
+        stage.count = len(senators)
+
+# the libyaml backed loader is many times faster, when pyyaml was built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+class SenatorRegistry(object):
+    """ Read only lookup of SenatorRecords by lis, shared by every report in a
+    process (see senator_registry). It is saved with marshal, which loads much
+    faster than unpickling Senator objects. """
+    VERSION = 1
+
+    def __init__(self, records):
+        self.records = dict((record.lis, record) for record in records)
+
+    def __getitem__(self, lis):
+        return self.records[lis]
+
+    def __contains__(self, lis):
+        return lis in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def get_senator_info(self, lis):
+        if lis in self.records:
+            return str(self.records[lis])
+        else:
+            return str(lis)
+
+    @classmethod
+    def save(cls, senators):
+        """ Saves the registry of the senators (Senator objects or SenatorRecords). """
+        records = dict((senator.lis, (senator.name, tuple(senator.parties), tuple(senator.states), senator.current))
+                       for senator in senators)
+        with atomic_open("data/legislators/{}".format(LEGISLATORS_REGISTRY)) as f:
+            marshal.dump((cls.VERSION, records), f)
+
+    @classmethod
+    def load(cls):
+        """ Loads the saved registry, building it from the legislators pickle or
+        yaml files if it is missing or was saved by another version. """
+        path = "data/legislators/{}".format(LEGISLATORS_REGISTRY)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                version, records = marshal.load(f)
+            if version == cls.VERSION:
+                return cls(SenatorRecord(lis, *record) for lis, record in records.items())
+        if os.path.exists("data/legislators/{}".format(LEGISLATORS_PICKLE)):
+            cls.save(SenatorLookup().senators.values())
+        else:
+            load_senators(False)
+        return cls.load()
+
+_registry = None
+_registry_mtime = None
+
+def senator_registry():
+    """ The SenatorRegistry of this process, loaded once and loaded again only when
+    load_senators has saved a new one. """
+    global _registry, _registry_mtime
+    path = "data/legislators/{}".format(LEGISLATORS_REGISTRY)
+    mtime = os.path.exists(path) and os.path.getmtime(path) or None
+    if _registry is None or mtime != _registry_mtime:
+        with Stage('senator-registry') as stage:
+            _registry = SenatorRegistry.load()
+            stage.count = len(_registry)
+        _registry_mtime = os.path.getmtime(path)
+    return _registry
+
+class SenatorRecord(namedtuple('SenatorRecord', ('lis', 'name', 'parties', 'states', 'current'))):
+    """ Read only information about a given Senator. """
+    __slots__ = ()
+
+    def __str__(self):
+        return '{} ({} - {})'.format(self.name, ','.join(self.parties), ','.join(self.states))
+
+class BetrayalCounts(object):
+    """ The vote_cnt, betrayal_cnt and futile_cnt of a Senator, and the figures derived from them. """
+    @property
+    def total_betrayal_pct(self):
+        try:
+            return self.total_betrayal_cnt / float(self.vote_cnt)
+        except ZeroDivisionError:
+            return 0.0
+
+    @property
+    def success_pct(self):
+        try:
+            return self.betrayal_cnt / float(self.total_betrayal_cnt)
+        except ZeroDivisionError:
+            return 0.0
+    @property
+    def total_betrayal_cnt(self):
+        return self.betrayal_cnt + self.futile_cnt
+
+class SenatorTally(BetrayalCounts):
+    """ The counts of one report for a Senator, kept apart from the shared SenatorRecord. """
+    def __init__(self, record, vote_cnt = 0, betrayal_cnt = 0, futile_cnt = 0):
+        self.record = record
+        self.vote_cnt = vote_cnt
+        self.betrayal_cnt = betrayal_cnt
+        self.futile_cnt = futile_cnt
+
+    @property
+    def lis(self):
+        return self.record.lis
+
+    @property
+    def current(self):
+        return self.record.current
+
+    def __str__(self):
+        return str(self.record)
 
 class SenatorLookup(object):
     """ Class for holding senator information."""
@@ -166,7 +402,7 @@ class SenatorLookup(object):
         else:
             return str(lis)
 
-class Senator(object):
+class Senator(BetrayalCounts):
     """ Utility class for holding information about a given Senator. """
     def __init__(self, data, current):
         self.lis = data['id']['lis']
@@ -178,23 +414,6 @@ class Senator(object):
         self.betrayal_cnt = 0
         self.futile_cnt = 0
 
-    @property
-    def total_betrayal_pct(self):
-        try:
-            return self.total_betrayal_cnt / float(self.vote_cnt)
-        except ZeroDivisionError:
-            return 0.0
-
-    @property
-    def success_pct(self):
-        try:
-            return self.betrayal_cnt / float(self.total_betrayal_cnt)
-        except ZeroDivisionError:
-            return 0.0
-    @property
-    def total_betrayal_cnt(self):
-        return self.betrayal_cnt + self.futile_cnt
-
     def _name_from_data(self, data):
         name_data = data['name']
         if 'official_full' in name_data:
@@ -220,22 +439,105 @@ class Senator(object):
         return '{} ({} - {})'.format(self.name, ','.join(self.parties), ','.join(self.states))
 
 class UnknownResultError(ValueError):
-    pass
+    """ Raised for a roll call whose result could not be classified as a success or a
+    failure, keeping the vote_result and vote_result_text it was classified from. """
+    def __init__(self, result, result_text = None):
+        ValueError.__init__(self, '{} is not a documented result'.format(result if result_text is None
+                                                                         else '{!r} / {!r}'.format(result, result_text)))
+        self.result = result
+        self.result_text = result_text
+
+""" A tally such as (52-48) at the end of a vote_result_text. """
+RESULT_TALLY = re.compile(r'\s*\(\s*\d+\s*-\s*\d+\s*\)\s*$')
+
+def normalize_result(result):
+    """ A result in lower case, without a trailing tally, punctuation or repeated spaces. """
+    return ' '.join(RESULT_TALLY.sub('', result).lower().split()).rstrip('.,;:')
+
+class ResultClassifier(object):
+    """ Decides whether the yeas (Y) or the nays (N) won from a result, trying in turn:
+    exact: the result is one of the success or fail words
+    normalized: the result is one of them after normalize_result
+    prefix: the normalized result starts with one of them as whole words, taking the
+            longest (so 'Motion to Table Agreed to, as amended' is 'Motion to Table Agreed to')
+    The lookups are built once, from the word tables. """
+    def __init__(self, success_words, fail_words):
+        self.exact = dict([(word, 'Y') for word in success_words] + [(word, 'N') for word in fail_words])
+        self.normalized = dict((normalize_result(word), success) for word, success in self.exact.items())
+        self.prefix = re.compile(r'^(?:{})(?![a-z0-9])'.format(
+            '|'.join(re.escape(word) for word in sorted(self.normalized, key=len, reverse=True))))
+
+    def classify(self, result):
+        """ (Y or N, how it was classified), or (None, None) if it could not be. """
+        if result is None:
+            return None, None
+        if result in self.exact:
+            return self.exact[result], 'exact'
+        normalized = normalize_result(result)
+        if normalized in self.normalized:
+            return self.normalized[normalized], 'normalized'
+        match = self.prefix.match(normalized)
+        if match:
+            return self.normalized[match.group(0)], 'prefix'
+        return None, None
+
+RESULT_CLASSIFIER = ResultClassifier(SUCCESS_WORDS, FAIL_WORDS)
+
+""" Ways a result can be classified (see ResultClassifier and RollCall.classified_by). """
+CLASSIFICATION_METHODS = ('exact', 'normalized', 'prefix', 'text')
 
 def successful(result):
     """ Returns string indicating if yeas (Y) or nays (N) won a given roll call. """
-    if result in SUCCESS_WORDS:
-        return 'Y'
-    if result in FAIL_WORDS:
-        return 'N'
-    if result == 'unknown':
-        raise UnknownResultError('Result in other field. TODO: parse other field')
-    raise ValueError('{} is not a documented result'.format(result))
+    success, method = RESULT_CLASSIFIER.classify(result)
+    if success is None:
+        raise UnknownResultError(result)
+    return success
 
 class RollCallManager(object):
-    """ Class for holding an array of roll_calls. """
-    def __init__(self):
+    """ Class for holding an array of roll_calls, and the column stores of any
+    years loaded in columnar form. """
+    def __init__(self, years = ()):
+        self.years = list(years)
         self.roll_calls = []
+        self.column_stores = []
+
+    def load_columns(self, year):
+        """ Adds and returns the column stores of a year, one for each part of its
+        store (see year_store_parts). The columns of a part are built from its
+        pickled roll calls if they are missing or older than the pickle. Nothing
+        is read from the columns until they are used. """
+        require_numpy()
+        stores = []
+        with Stage('load-columns', year) as stage:
+            for pickle_path, columns_path in year_store_parts(year):
+                vocabulary_path = os.path.join(columns_path, COLUMN_VOCABULARY_FILE)
+                if not os.path.exists(vocabulary_path) or os.path.getmtime(vocabulary_path) < os.path.getmtime(pickle_path):
+                    with open(pickle_path, 'rb') as f:
+                        save_columns(columns_path, pickle.load(f))
+                stores.append(ColumnStore(columns_path))
+            stage.count = len(stores)
+        self.column_stores.extend(stores)
+        return stores
+
+class StreamedRollCalls(object):
+    """ Stands in for RollCallManager.roll_calls when a report walks the roll calls of
+    many years: each iteration reads the years one at a time from their stores (the
+    pickles, or the columns if storage is 'columns'), so that only one year's roll
+    calls are held in memory at once. The roll calls come in the same order as the
+    list run() would build. """
+    def __init__(self, years, storage = 'pickle'):
+        self.years = list(years)
+        self.storage = storage
+
+    def __iter__(self):
+        for year in self.years:
+            for roll_call in self.year_roll_calls(year):
+                yield roll_call
+
+    def year_roll_calls(self, year):
+        if self.storage == 'columns':
+            return (roll_call for store in RollCallManager().load_columns(year) for roll_call in store.roll_calls())
+        return load_roll_calls(year)
 
 def solo_node_value(doc, node_name):
     for node in doc.getElementsByTagName(node_name):
@@ -244,6 +546,10 @@ def text_value(node):
     for c in node.childNodes:
         return c.toxml()
 
+""" Elements the streaming parser keeps from a roll call and from each of its members. """
+STREAM_ROLL_CALL_FIELDS = ('congress', 'session', 'vote_number', 'majority_requirement', 'vote_result', 'vote_result_text')
+STREAM_MEMBER_FIELDS = ('lis_member_id', 'party', 'vote_cast')
+
 class RollCall(object):
     """ Class for retaining information about the results of a roll call of votes in the Senate.
 
@@ -257,18 +563,104 @@ class RollCall(object):
                      example, the keys would be Democrat-N, Democrat-Y, Republican-N, Republican-Y
                      for a roll call with senators in each category, and the total would add up to 2
                      (100% for each party)
+    yea_count, nay_count: how many yeas and nays
+    betrayal_cnt: how many votes were against the majority of the voter's party
+    futile_cnt: how many votes were with the majority of the voter's party but lost
+    betrayal_necessary: see _is_betrayal_necessary
+    classified_by: how success was found from the resolution -- one of CLASSIFICATION_METHODS,
+                   'text' meaning that vote_result could not be classified and the resolution
+                   was taken from vote_result_text instead
+
+    The counts are worked out once when the roll call is built and are pickled with it.
     """
+    __slots__ = ('roll_call_id', 'requires', 'votes', 'resolution', 'success', 'party_breakdown',
+                 'yea_count', 'nay_count', 'betrayal_cnt', 'futile_cnt', 'betrayal_necessary', 'classified_by')
 
     def __init__(self, roll_call_data):
-        self.roll_call_id = '{}{}{}'.format(solo_node_value(roll_call_data, 'congress'),
+        self._build('{}{}{}'.format(solo_node_value(roll_call_data, 'congress'),
                                     solo_node_value(roll_call_data, 'session'),
-                                    solo_node_value(roll_call_data, 'vote_number'))
-        self.requires = solo_node_value(roll_call_data, 'majority_requirement')
-        self.votes = self._load_votes(roll_call_data)
-        self.resolution = solo_node_value(roll_call_data, 'vote_result')
-        self.success = successful(self.resolution)
+                                    solo_node_value(roll_call_data, 'vote_number')),
+                    solo_node_value(roll_call_data, 'majority_requirement'),
+                    self._load_votes(roll_call_data),
+                    solo_node_value(roll_call_data, 'vote_result'),
+                    solo_node_value(roll_call_data, 'vote_result_text'))
+
+    @classmethod
+    def from_stream(cls, f):
+        """ Builds a RollCall from an open roll call xml file in a single
+        incremental pass, without keeping a DOM of the whole document. """
+        fields = {}
+        votes = []
+        member = None
+        loaded = False
+        for event, elem in ElementTree.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag == 'member':
+                    member = {}
+                continue
+            if member is not None:
+                if elem.tag == 'member':
+                    vote = member.get('vote_cast')
+                    if vote in VERDICTS:
+                        loaded = True
+                        votes.append(Vote(member.get('lis_member_id'),
+                                          member.get('party'),
+                                          VERDICTS[vote]))
+                    member = None
+                    elem.clear()
+                elif elem.tag in STREAM_MEMBER_FIELDS:
+                    member.setdefault(elem.tag, elem.text)
+            elif elem.tag in STREAM_ROLL_CALL_FIELDS:
+                fields.setdefault(elem.tag, elem.text)
+        if not loaded:
+            raise ValueError('Nothing useful to count')
+        roll_call = cls.__new__(cls)
+        roll_call._build('{}{}{}'.format(fields.get('congress'),
+                                         fields.get('session'),
+                                         fields.get('vote_number')),
+                         fields.get('majority_requirement'),
+                         votes,
+                         fields.get('vote_result'),
+                         fields.get('vote_result_text'))
+        return roll_call
+
+    def _build(self, roll_call_id, requires, votes, resolution, result_text = None):
+        """ Sets up the roll call. If the resolution (vote_result) cannot be classified,
+        result_text (vote_result_text) is tried instead, and becomes the resolution
+        without its tally. Raises UnknownResultError if neither can be classified. """
+        success, method = RESULT_CLASSIFIER.classify(resolution)
+        if success is None and result_text:
+            success, method = RESULT_CLASSIFIER.classify(result_text)
+            if success is not None:
+                resolution, method = RESULT_TALLY.sub('', result_text), 'text'
+        if success is None:
+            raise UnknownResultError(resolution, result_text)
+        self.roll_call_id = roll_call_id
+        self.requires = requires
+        self.votes = votes
+        self.resolution = resolution
+        self.success = success
+        self.classified_by = method
         self.party_breakdown = self._calculate_party_breakdown()
         self._set_betrayal_attributes_on_votes()
+        self._count_votes()
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        """ Restores a pickled roll call. Roll calls pickled before RollCall had
+        __slots__ have a dictionary of attributes as state and no counts, so the
+        counts are worked out as they are loaded. """
+        if isinstance(state, dict):
+            for name, value in state.items():
+                setattr(self, name, value)
+            self._count_votes()
+            self.classified_by = None
+        else:
+            # state saved before classified_by was added is one shorter
+            for name, value in itertools.izip_longest(self.__slots__, state):
+                setattr(self, name, value)
 
     def party_won(self, party):
         """ Whether the majority of votes by senators in the given party were
@@ -318,30 +710,30 @@ class RollCall(object):
             vote.betrayed_party = self.success == vote.vote_answer and not party_won
             vote.futile_betrayal = self.success != vote.vote_answer and party_won
 
-    @property
-    def yea_count(self):
-        """ How many yeas. """
-        return len([vote for vote in self.votes if vote.vote_answer == 'Y'])
-
-    @property
-    def nay_count(self):
-        """ How many nays. """
-        return len([vote for vote in self.votes if vote.vote_answer == 'N'])
-
-    @property
-    def betrayal_cnt(self):
-        """ How many votes were against the majority of the voter's party. """
-        return len([vote for vote in self.votes if vote.betrayed_party])
+    def _count_votes(self):
+        """ Sets the yea, nay, betrayal and futile counts and betrayal_necessary
+        in a single pass over the votes. """
+        yea_count = betrayal_cnt = futile_cnt = 0
+        for vote in self.votes:
+            if vote.vote_answer == 'Y':
+                yea_count += 1
+            if vote.betrayed_party:
+                betrayal_cnt += 1
+            if vote.futile_betrayal:
+                futile_cnt += 1
+        self.yea_count = yea_count
+        self.nay_count = len(self.votes) - yea_count
+        self.betrayal_cnt = betrayal_cnt
+        self.futile_cnt = futile_cnt
+        self.betrayal_necessary = self._is_betrayal_necessary()
 
-    @property
-    def betrayal_necessary(self):
+    def _is_betrayal_necessary(self):
         """ Whether the ultimate resolution of the roll call could have been accomplished
         by a single party without the assistance of members of the other. For example,
         consider a roll call that requires 1/2 is a success. If the yeas of one party
         on its own were greater than 50% of the roll call, then no betrayal would have been
         necesssary. However, if the yeas of neither party on its own surpassed the 50%
         mark, then betrayal was necessary."""
-        betrayals = self.betrayal_cnt
         if self.betrayal_cnt == 0:
             return False
         if self.success == 'Y':
@@ -353,6 +745,12 @@ class RollCall(object):
             number_non_betrayals = self.nay_count - self.betrayal_cnt
             return number_nays_needed > number_non_betrayals
 
+""" Ways of building a RollCall from an open roll call xml file. """
+PARSERS = {
+    'dom': lambda f: RollCall(parse(f)),
+    'stream': RollCall.from_stream,
+}
+
 def necessary_yeas(nays, requires):
     """ Based on the number of nays and the requirement for success,
     how many yeas would be necessary to carry the roll call. Assumes ties
@@ -381,6 +779,8 @@ def necessary_nays(yeas, requires):
 
 class Vote(object):
     """ Utility class for holding attributes of a given Senator's vote. """
+    __slots__ = ('senator_id', 'party', 'vote_answer', 'betrayed_party', 'futile_betrayal')
+
     def __init__(self, senator_id, party, vote_answer):
         self.senator_id = senator_id
         self.party = party
@@ -388,6 +788,17 @@ class Vote(object):
         self.betrayed_party = None
         self.futile_betrayal = None
 
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        """ Restores a pickled vote, whose state is a dictionary if it was pickled
+        before Vote had __slots__. """
+        if isinstance(state, dict):
+            state = tuple(state.get(name) for name in self.__slots__)
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
 SORT_KEYS = {
     'all': lambda x: x.vote_cnt,
     'total': lambda x: x.total_betrayal_cnt,
@@ -397,20 +808,20 @@ SORT_KEYS = {
     'pct': lambda x: x.success_pct,
 }
 
-def calculate_betrayal(vm, only_necessary = False, only_current = False, only_candidates = False, limit = 20, sort = 'pct'):
-    sl = SenatorLookup()
-    senators = set()
-    for roll_call in vm.roll_calls:
-        if only_necessary and not roll_call.betrayal_necessary:
-            continue
-        for vote in roll_call.votes:
-            senator = sl.senators[vote.senator_id]
-            senators.add(senator)
-            senator.vote_cnt += 1
-            if vote.betrayed_party:
-                senator.betrayal_cnt += 1
-            if vote.futile_betrayal:
-                senator.futile_cnt += 1
+def calculate_betrayal(vm, only_necessary = False, only_current = False, only_candidates = False, limit = 20, sort = 'pct', engine = 'objects', senators = None):
+    """ Prints the report. If senators (lis ids) are given, only their votes are
+    counted, from the SenatorIndex of each year whatever the engine. """
+    if senators is not None:
+        with Stage('count-indexed') as stage:
+            counts = count_betrayals_indexed(vm.years, senators, only_necessary)
+            stage.count = len(counts)
+    else:
+        with Stage('count-' + engine) as stage:
+            counts = BETRAYAL_ENGINES[engine](vm, only_necessary)
+            stage.count = len(counts)
+    with Stage('tally') as stage:
+        senators = tally_senators(counts)
+        stage.count = len(senators)
     if only_necessary:
         print 'Only considering occasions in which neither party had enough votes to win'
     if only_current:
@@ -418,21 +829,671 @@ def calculate_betrayal(vm, only_necessary = False, only_current = False, only_ca
     print 'Number of votes opposed to own party that subverted party desire, by senator'
     print '   All   Total  Pct Tot   Successful  Success Pct  Senator'
 
-    print_cnt = 0
-
-    for senator in sorted(senators, reverse=True, key=SORT_KEYS[sort]):
-        if only_candidates and senator.lis not in CANDIDATE_IDS:
-            continue
-        if only_current and not senator.current:
-            continue
+    with Stage('rank') as stage:
+        ranked = ranked_senators(senators, only_current, only_candidates, limit, sort)
+        stage.count = len(ranked)
+    for senator in ranked:
         all_votes = senator.vote_cnt
         total = senator.total_betrayal_cnt
         betrayal_count = senator.betrayal_cnt
         success_pct = senator.success_pct
-        print_cnt += 1
         print '{:>6} {:>6} {:>8.2f} {:>10} {:>12.2f}     {}'.format(all_votes, total, senator.total_betrayal_pct, betrayal_count, success_pct, str(senator))
-        if limit > 0 and print_cnt >= limit:
+
+def report_senators(senators = None, only_current = False, only_candidates = False):
+    """ The lis ids a report is limited to by a list of senators, --only-current and
+    --only-pc, or None if it covers every senator. """
+    if senators is None and not only_current and not only_candidates:
+        return None
+    selected = set(senators) if senators is not None else None
+    if only_candidates:
+        selected = set(CANDIDATE_IDS) if selected is None else selected & set(CANDIDATE_IDS)
+    if only_current:
+        registry = senator_registry()
+        current = set(lis for lis in registry.records if registry[lis].current)
+        selected = current if selected is None else selected & current
+    return sorted(selected)
+
+def tally_senators(counts, registry = None):
+    """ SenatorTallies for counts, a dictionary of lis to [vote_cnt, betrayal_cnt, futile_cnt],
+    with the senators looked up in the registry (the shared senator_registry() if None). """
+    registry = registry or senator_registry()
+    return [SenatorTally(registry[lis], vote_cnt, betrayal_cnt, futile_cnt)
+            for lis, (vote_cnt, betrayal_cnt, futile_cnt) in counts.items()]
+
+def ranked_senators(senators, only_current = False, only_candidates = False, limit = 20, sort = 'pct'):
+    """ The senators to report on, in report order. Ties are broken by lis so
+    that the order does not depend on how the senators were counted. """
+    ranked = []
+    for senator in sorted(sorted(senators, key=lambda x: x.lis), reverse=True, key=SORT_KEYS[sort]):
+        if only_candidates and senator.lis not in CANDIDATE_IDS:
+            continue
+        if only_current and not senator.current:
+            continue
+        ranked.append(senator)
+        if limit > 0 and len(ranked) >= limit:
+            break
+    return ranked
+
+def count_betrayals(roll_calls, only_necessary = False):
+    """ Dictionary of lis to [vote_cnt, betrayal_cnt, futile_cnt] over the roll
+    calls. This walks the Vote objects and is the reference for the other engines. """
+    counts = defaultdict(lambda: [0, 0, 0])
+    for roll_call in roll_calls:
+        if only_necessary and not roll_call.betrayal_necessary:
+            continue
+        for vote in roll_call.votes:
+            senator_counts = counts[vote.senator_id]
+            senator_counts[0] += 1
+            if vote.betrayed_party:
+                senator_counts[1] += 1
+            if vote.futile_betrayal:
+                senator_counts[2] += 1
+    return counts
+
+def count_betrayals_vectorized(column_stores, only_necessary = False):
+    """ Same as count_betrayals, computed with grouped array operations over the
+    column stores of any number of years at once. """
+    columns = VoteColumns(column_stores)
+    betrayed, futile, necessary = betrayal_flags(columns)
+    senator = columns.vote_senator
+    if only_necessary:
+        keep = necessary[columns.vote_roll_call]
+        senator, betrayed, futile = senator[keep], betrayed[keep], futile[keep]
+    size = len(columns.senators)
+    vote_cnt = numpy.bincount(senator, minlength=size)
+    betrayal_cnt = numpy.bincount(senator, weights=betrayed, minlength=size).astype(numpy.int64)
+    futile_cnt = numpy.bincount(senator, weights=futile, minlength=size).astype(numpy.int64)
+    return dict((columns.senators[i], [int(vote_cnt[i]), int(betrayal_cnt[i]), int(futile_cnt[i])])
+                for i in numpy.flatnonzero(vote_cnt))
+
+class VoteColumns(object):
+    """ The columns of several ColumnStores concatenated into single arrays, with
+    their integer codes mapped onto shared vocabularies (senators, parties,
+    requires, resolutions). vote_roll_call gives the position in the roll call
+    columns of the roll call each vote belongs to.
+
+    Each column, and each vocabulary, is built the first time it is used, so that
+    memory scales with the columns a computation touches. """
+    VOCABULARIES = {'senators': 'senator', 'parties': 'party', 'requires': 'requires', 'resolutions': 'resolution'}
+
+    def __init__(self, column_stores):
+        require_numpy()
+        self.column_stores = list(column_stores)
+        self.vocabularies = dict((name, []) for name in self.VOCABULARIES.values())
+        self.codes = dict((name, {}) for name in self.VOCABULARIES.values())
+
+    def __getattr__(self, name):
+        if name in self.VOCABULARIES:
+            for column_name, vocabulary_name in COLUMN_VOCABULARIES.items():
+                if vocabulary_name == self.VOCABULARIES[name]:
+                    getattr(self, column_name)
+            value = self.vocabularies[self.VOCABULARIES[name]]
+        elif name == 'vote_roll_call':
+            parts = []
+            roll_call_cnt = 0
+            for store in self.column_stores:
+                parts.append(numpy.repeat(numpy.arange(roll_call_cnt, roll_call_cnt + len(store)),
+                                          numpy.diff(store.column('roll_call_offset'))))
+                roll_call_cnt += len(store)
+            value = self._concatenate(parts)
+        elif name in ROLL_CALL_COLUMN_NAMES + VOTE_COLUMN_NAMES and name != 'roll_call_offset':
+            value = self._concatenate([self._recode(store, name) if name in COLUMN_VOCABULARIES else store.column(name)
+                                       for store in self.column_stores])
+        else:
+            raise AttributeError(name)
+        setattr(self, name, value)
+        return value
+
+    def _recode(self, store, name):
+        vocabulary_name = COLUMN_VOCABULARIES[name]
+        vocabulary, vocabulary_codes = self.vocabularies[vocabulary_name], self.codes[vocabulary_name]
+        mapping = []
+        for word in store.vocabulary[vocabulary_name]:
+            if word not in vocabulary_codes:
+                vocabulary_codes[word] = len(vocabulary)
+                vocabulary.append(word)
+            mapping.append(vocabulary_codes[word])
+        return numpy.array(mapping, dtype=store.column(name).dtype)[store.column(name)]
+
+    @staticmethod
+    def _concatenate(parts):
+        return numpy.concatenate(parts) if parts else numpy.array([], dtype=numpy.int64)
+
+def betrayal_flags(columns):
+    """ Returns (betrayed_party, futile_betrayal, betrayal_necessary) for VoteColumns:
+    the first two as boolean arrays over the votes and the last as a boolean array over
+    the roll calls, with the same meaning as the RollCall and Vote attributes. """
+    roll_call_cnt = len(columns.roll_call_success)
+    party_cnt = len(columns.parties)
+    roll_call = columns.vote_roll_call
+    answer = columns.vote_answer.astype(bool)
+    success = columns.roll_call_success.astype(bool)
+
+    # party_breakdown: yeas and total votes of each party in each roll call
+    group = roll_call * party_cnt + columns.vote_party
+    party_total = numpy.bincount(group, minlength=roll_call_cnt * party_cnt)[group]
+    party_yeas = numpy.bincount(group, weights=answer, minlength=roll_call_cnt * party_cnt).astype(numpy.int64)[group]
+    vote_success = success[roll_call]
+    party_on_success = numpy.where(vote_success, party_yeas, party_total - party_yeas)
+    party_won = 2 * party_on_success > party_total
+
+    on_success = answer == vote_success
+    betrayed = on_success & ~party_won
+    futile = ~on_success & party_won
+
+    yea_count = numpy.bincount(roll_call, weights=answer, minlength=roll_call_cnt).astype(numpy.int64)
+    nay_count = numpy.bincount(roll_call, minlength=roll_call_cnt) - yea_count
+    betrayal_cnt = numpy.bincount(roll_call, weights=betrayed, minlength=roll_call_cnt).astype(numpy.int64)
+    return betrayed, futile, necessary_mask(columns, yea_count, nay_count, betrayal_cnt)
+
+def necessary_mask(columns, yea_count, nay_count, betrayal_cnt):
+    """ RollCall.betrayal_necessary over arrays of per roll call counts, using
+    necessary_yeas and necessary_nays on each requirement in turn. """
+    success = columns.roll_call_success.astype(bool)
+    yeas_needed = numpy.zeros(len(success), dtype=numpy.int64)
+    nays_needed = numpy.zeros(len(success), dtype=numpy.int64)
+    for code, requires in enumerate(columns.requires):
+        rows = (columns.roll_call_requires == code) & (betrayal_cnt > 0)
+        if rows.any():
+            yeas_needed[rows] = necessary_yeas(nay_count[rows], requires)
+            nays_needed[rows] = necessary_nays(yea_count[rows], requires)
+    return (betrayal_cnt > 0) & numpy.where(success,
+                                            yeas_needed > yea_count - betrayal_cnt,
+                                            nays_needed > nay_count - betrayal_cnt)
+
+def count_betrayals_indexed(years, senators = None, only_necessary = False):
+    """ Same as count_betrayals over the roll calls of the years, for just the
+    senators (lis ids) given, or all if None, read from the SenatorIndex of each
+    year. Only the votes of those senators are read. """
+    counts = {}
+    for year in years:
+        index = SenatorIndex.load(year)
+        for lis in index.senators() if senators is None else senators:
+            entries = index.entries(lis)
+            if only_necessary:
+                entries = [entry for entry in entries if entry[5]]
+            if entries:
+                add_counts(counts, {lis: [len(entries),
+                                          sum(entry[3] for entry in entries),
+                                          sum(entry[4] for entry in entries)]})
+    return counts
+
+def count_betrayals_cached(years, only_necessary = False):
+    """ Same as count_betrayals over the roll calls of the years, summed from
+    the cached aggregates of each year. """
+    counts = {}
+    for year in years:
+        add_counts(counts, year_aggregates(year)[only_necessary and 'necessary' or 'all'])
+    return counts
+
+def year_aggregates(year):
+    """ The aggregates of a year (see save_roll_calls). If they are missing, or were
+    not built from the current roll call xml files and classification tables (see
+    store_current), raises StaleStoreError: reports do not download or parse anything
+    themselves, run() brings the years up to date first (see ready_years). """
+    with Stage('aggregates', year):
+        aggregates = read_aggregates(year)
+        current = store_current(year, aggregates)
+    if not current:
+        raise StaleStoreError(year)
+    return aggregates
+
+def read_aggregates(year):
+    """ The aggregates of a year as last saved, or None. """
+    path = "data/rollcalls/{}/{}".format(year, AGGREGATES_PICKLE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def save_aggregates(year, aggregates, manifest):
+    """ Saves the aggregates of a year in data/{year}/aggregates.pickle, with the
+    manifest_fingerprint of the manifest of the store they describe. """
+    aggregates['fingerprint'] = manifest_fingerprint(manifest)
+    with atomic_open("data/rollcalls/{}/{}".format(year, AGGREGATES_PICKLE)) as f:
+        pickle.dump(aggregates, f)
+
+def add_counts(counts, more_counts):
+    """ Adds the [vote_cnt, betrayal_cnt, futile_cnt] of more_counts into counts. """
+    for lis, senator_more_counts in more_counts.items():
+        senator_counts = counts.setdefault(lis, [0, 0, 0])
+        for i, count in enumerate(senator_more_counts):
+            senator_counts[i] += count
+
+def aggregate_files(aggregates):
+    """ Vote numbers of every xml file the aggregates of a year were built from,
+    stored or quarantined. """
+    return aggregates['vote_numbers'] + aggregates.get('quarantine', [])
+
+def store_current(year, aggregates = None, added = False):
+    """ Whether the store of a year is up to date with its downloaded xml files and the
+    classification tables, according to its manifest (see year_changes), and its
+    aggregates (read if None) describe that store. Files downloaded since that are not
+    in the store yet make it out of date unless added is set. Files that were only
+    touched have their manifest records refreshed, so that they are hashed only once. """
+    aggregates = aggregates or read_aggregates(year)
+    if not aggregates or 'vote_numbers' not in aggregates:
+        return False
+    changes = year_changes(year)
+    if changes['stale'] or changes['changed'] or changes['removed'] or (changes['added'] and not added):
+        return False
+    manifest = read_manifest(year)
+    if aggregates['fingerprint'] != manifest_fingerprint(manifest):
+        return False
+    refresh_manifest(year, manifest, changes['touched'])
+    return True
+
+def classification_fingerprint():
+    """ Digest of the tables that decide the answer of a vote and the success of a roll call. """
+    return hashlib.sha1(repr((SUCCESS_WORDS, FAIL_WORDS, sorted(VERDICTS.items()), CLASSIFICATION_METHODS))).hexdigest()
+
+""" Ways of computing the counts behind calculate_betrayal from a RollCallManager. """
+BETRAYAL_ENGINES = {
+    'cached': lambda vm, only_necessary: count_betrayals_cached(vm.years, only_necessary),
+    'indexed': lambda vm, only_necessary: count_betrayals_indexed(vm.years, None, only_necessary),
+    'objects': lambda vm, only_necessary: count_betrayals(vm.roll_calls, only_necessary),
+    'vectorized': lambda vm, only_necessary: count_betrayals_vectorized(vm.column_stores, only_necessary),
+}
+
+def check_engines(vm):
+    """ Compares the report of every BETRAYAL_ENGINES engine for every sort and
+    for --only-necessary, printing any that differ from the objects engine. """
+    mismatches = 0
+    for only_necessary in (False, True):
+        reports = {}
+        for engine, count in BETRAYAL_ENGINES.items():
+            counts = count(vm, only_necessary)
+            senators = tally_senators(counts)
+            reports[engine] = dict((sort, [(senator.lis, senator.vote_cnt, senator.betrayal_cnt, senator.futile_cnt)
+                                           for senator in ranked_senators(senators, limit=0, sort=sort)])
+                                   for sort in SORT_KEYS)
+        for engine, report in reports.items():
+            for sort in SORT_KEYS:
+                if report[sort] != reports['objects'][sort]:
+                    mismatches += 1
+                    print 'Engine {} differs from objects with sort {}{}'.format(engine, sort, only_necessary and ' and --only-necessary' or '')
+    print '{} engines compared on {} roll calls, {} mismatches'.format(len(BETRAYAL_ENGINES), len(vm.roll_calls), mismatches)
+    return mismatches == 0
+
+""" Roll calls put in each dense block of the agreement matrix products. Memory use
+is about 8 bytes per senator per roll call of a block, plus the senator x senator totals. """
+AGREEMENT_BLOCK = 2048
+
+def agreement_matrix(column_stores, only_necessary = False, block_size = AGREEMENT_BLOCK):
+    """ Pairwise agreement of the senators over the roll calls of the column stores.
+
+    Returns (senators, shared, agreed): the lis ids in order, and senator x senator
+    integer arrays of the roll calls in which both senators voted and those in which
+    they voted the same way. The roll calls are taken block_size at a time as dense
+    senator x roll call matrices, +1 for a yea, -1 for a nay and 0 for no vote, so that
+    for a block A and its absolute value P the totals grow by P.P' (shared) and
+    (P.P' + A.A') / 2 (agreed).
+    """
+    columns = VoteColumns(column_stores)
+    roll_call_cnt = len(columns.roll_call_success)
+    if only_necessary:
+        keep = betrayal_flags(columns)[2]
+    else:
+        keep = numpy.ones(roll_call_cnt, dtype=bool)
+    # position of each kept roll call among the kept ones; votes stay in roll call order
+    position = numpy.cumsum(keep) - 1
+    kept_votes = keep[columns.vote_roll_call]
+    vote_position = position[columns.vote_roll_call][kept_votes]
+    vote_senator = columns.vote_senator[kept_votes]
+    vote_sign = numpy.where(columns.vote_answer[kept_votes].astype(bool), 1, -1).astype(numpy.float32)
+
+    senator_cnt = len(columns.senators)
+    shared = numpy.zeros((senator_cnt, senator_cnt), dtype=numpy.float64)
+    cross = numpy.zeros((senator_cnt, senator_cnt), dtype=numpy.float64)
+    kept_cnt = int(keep.sum())
+    for start in xrange(0, kept_cnt, block_size):
+        stop = min(start + block_size, kept_cnt)
+        first, last = numpy.searchsorted(vote_position, [start, stop])
+        signs = numpy.zeros((senator_cnt, stop - start), dtype=numpy.float32)
+        signs[vote_senator[first:last], vote_position[first:last] - start] = vote_sign[first:last]
+        present = numpy.abs(signs)
+        shared += numpy.dot(present, present.T)
+        cross += numpy.dot(signs, signs.T)
+    shared = numpy.rint(shared).astype(numpy.int64)
+    agreed = (shared + numpy.rint(cross).astype(numpy.int64)) // 2
+    return list(columns.senators), shared, agreed
+
+def aligned_senators(shared, agreed, row, top, min_shared = 1):
+    """ Indexes of the top senators most and least in agreement with senator row, as
+    two lists of (index, agreement), among those who shared at least min_shared votes
+    with it. Ties are broken by index. """
+    others = numpy.flatnonzero(shared[row] >= max(min_shared, 1))
+    others = others[others != row]
+    rates = agreed[row, others] / shared[row, others].astype(numpy.float64)
+    order = numpy.lexsort((others, -rates))
+    most = [(others[i], rates[i]) for i in order[:top]]
+    order = numpy.lexsort((others, rates))
+    least = [(others[i], rates[i]) for i in order[:top]]
+    return most, least
+
+def calculate_agreement(vm, only_necessary = False, only_current = False, only_candidates = False, top = 5, min_shared = 20, output = None):
+    """ Prints, for each senator, the top senators they most and least often voted the
+    same way as, and writes the agreement matrix as csv to output if given. """
+    with Stage('agreement') as stage:
+        senators, shared, agreed = agreement_matrix(vm.column_stores, only_necessary)
+        stage.count = len(senators)
+    registry = senator_registry()
+    order = sorted(range(len(senators)), key=lambda i: senators[i])
+    if output:
+        with atomic_open(output) as f:
+            writer = csv.writer(f)
+            writer.writerow(['lis'] + [senators[i] for i in order])
+            for i in order:
+                writer.writerow([senators[i]] + ['{:.4f}'.format(float(agreed[i, j]) / shared[i, j]) if shared[i, j] else ''
+                                                 for j in order])
+    if only_necessary:
+        print 'Only considering occasions in which neither party had enough votes to win'
+    print 'Share of roll calls voted the same way, among senators with at least {} roll calls in common'.format(min_shared)
+    for i in order:
+        lis = senators[i]
+        if only_candidates and lis not in CANDIDATE_IDS:
+            continue
+        if only_current and not (lis in registry and registry[lis].current):
+            continue
+        most, least = aligned_senators(shared, agreed, i, top, min_shared)
+        print registry.get_senator_info(lis)
+        for label, pairs in (('most', most), ('least', least)):
+            for j, rate in pairs:
+                print '  {:<6} {:>6.2f} {:>6}  {}'.format(label, rate, shared[i, j], registry.get_senator_info(senators[j]))
+
+def modeled_success(requires_codes, requires, yea_count, nay_count):
+    """ Whether the yeas carry each roll call by necessary_yeas, over arrays of
+    requires_codes (codes into the list requires) and counts. """
+    yeas_needed = numpy.zeros(len(requires_codes), dtype=numpy.int64)
+    for code, rule in enumerate(requires):
+        rows = requires_codes == code
+        if rows.any():
+            yeas_needed[rows] = necessary_yeas(nay_count[rows], rule)
+    return yea_count >= yeas_needed
+
+class Counterfactuals(object):
+    """ What would have happened had senators voted with their parties.
+
+    A vote against the majority of the voter's party (betrayed_party or
+    futile_betrayal) is switched to the other answer, and the outcome of its roll
+    call is worked out again with necessary_yeas. Every such vote is simulated on
+    its own, as a single batch of array operations over the columnar store, which
+    gives the roll calls each senator would have flipped by voting with their party;
+    and all of them are simulated together, which gives the roll calls that would
+    have flipped had every betrayer voted with their party.
+
+    Outcomes are compared with the modeled outcome of the actual votes rather than
+    the recorded resolution, so that ties and requirements the model treats
+    differently from the Senate are not counted as flips; recorded_mismatch_cnt
+    says how many roll calls that affects.
+
+    Attributes:
+    senators: lis ids, indexed by the codes of switch_senator
+    roll_call_ids: ids of the roll calls, indexed by the codes of switch_roll_call
+    switch_senator, switch_roll_call: the senator and roll call of each switched vote
+    switch_flips: whether switching that vote alone flips its roll call
+    all_flipped: whether switching every vote of its roll call flips it
+    """
+    def __init__(self, column_stores):
+        columns = VoteColumns(column_stores)
+        betrayed, futile, necessary = betrayal_flags(columns)
+        roll_call_cnt = len(columns.roll_call_success)
+        roll_call = columns.vote_roll_call
+        answer = columns.vote_answer.astype(bool)
+        yea_count = numpy.bincount(roll_call, weights=answer, minlength=roll_call_cnt).astype(numpy.int64)
+        nay_count = numpy.bincount(roll_call, minlength=roll_call_cnt) - yea_count
+        requires = columns.roll_call_requires
+        modeled = modeled_success(requires, columns.requires, yea_count, nay_count)
+
+        switch = betrayed | futile
+        self.senators = list(columns.senators)
+        self.roll_call_ids = columns.roll_call_id
+        self.switch_senator = columns.vote_senator[switch]
+        self.switch_roll_call = roll_call[switch]
+        # change in the yeas of the roll call when the vote switches
+        yea_change = numpy.where(answer[switch], -1, 1)
+        switched = self.switch_roll_call
+        self.switch_flips = modeled_success(requires[switched], columns.requires,
+                                            yea_count[switched] + yea_change,
+                                            nay_count[switched] - yea_change) != modeled[switched]
+        yea_change = numpy.bincount(switched, weights=yea_change, minlength=roll_call_cnt).astype(numpy.int64)
+        self.all_flipped = modeled_success(requires, columns.requires,
+                                           yea_count + yea_change, nay_count - yea_change) != modeled
+        self.recorded_mismatch_cnt = int((modeled != columns.roll_call_success.astype(bool)).sum())
+
+    def senator_flips(self):
+        """ Dictionary of lis to [switched_cnt, flipped_cnt]: the votes each senator
+        cast against their party, and the roll calls they would have flipped. """
+        size = len(self.senators)
+        switched_cnt = numpy.bincount(self.switch_senator, minlength=size)
+        flipped_cnt = numpy.bincount(self.switch_senator, weights=self.switch_flips, minlength=size).astype(numpy.int64)
+        return dict((self.senators[i], [int(switched_cnt[i]), int(flipped_cnt[i])])
+                    for i in numpy.flatnonzero(switched_cnt))
+
+    def flipped_by(self, lis):
+        """ Ids of the roll calls the senator would have flipped by voting with their party. """
+        if lis not in self.senators:
+            return []
+        flips = self.switch_flips & (self.switch_senator == self.senators.index(lis))
+        return [str(roll_call_id) for roll_call_id in self.roll_call_ids[self.switch_roll_call[flips]]]
+
+    def flipped_by_all(self):
+        """ Ids of the roll calls that would have flipped had every betrayer voted with their party. """
+        return [str(roll_call_id) for roll_call_id in self.roll_call_ids[self.all_flipped]]
+
+def simulate(vm, only_current = False, only_candidates = False, limit = 20, senators = ()):
+    """ Prints the roll calls whose outcome every betrayer voting with their party
+    would have changed, and the senators who would have changed the most outcomes
+    by doing so, listing the roll calls for the given senators. """
+    with Stage('simulate') as stage:
+        counterfactuals = Counterfactuals(vm.column_stores)
+        stage.count = len(counterfactuals.switch_flips)
+    registry = senator_registry()
+    flipped = counterfactuals.flipped_by_all()
+    print 'Roll calls simulated: {}, of which {} have a recorded result the vote count model disagrees with'.format(
+        len(counterfactuals.roll_call_ids), counterfactuals.recorded_mismatch_cnt)
+    print 'Outcomes changed if every betrayer had voted with their party: {}'.format(len(flipped))
+    print 'Outcomes each senator would have changed alone by voting with their party'
+    print ' Against  Flipped  Senator'
+    flips = counterfactuals.senator_flips()
+    shown = 0
+    for lis, (switched_cnt, flipped_cnt) in sorted(sorted(flips.items()), key=lambda x: x[1][1], reverse=True):
+        if only_candidates and lis not in CANDIDATE_IDS:
+            continue
+        if only_current and not (lis in registry and registry[lis].current):
+            continue
+        print '{:>8} {:>8}  {}'.format(switched_cnt, flipped_cnt, registry.get_senator_info(lis))
+        shown += 1
+        if limit > 0 and shown >= limit:
             break
+    for lis in senators:
+        print 'Roll calls {} would have flipped: {}'.format(registry.get_senator_info(lis),
+                                                            ' '.join(counterfactuals.flipped_by(lis)) or 'none')
+
+""" Replicates drawn by each bootstrap task. Every chunk has its own random state,
+seeded from the seed and the number of the chunk, so the replicates do not depend
+on how many processes draw them. """
+BOOTSTRAP_CHUNK = 50
+""" The metrics of SORT_KEYS in the order the bootstrap keeps them, followed by rank. """
+BOOTSTRAP_METRICS = ('all', 'total', 'tot_pct', 'success', 'fail', 'pct')
+
+class BootstrapVotes(object):
+    """ The votes of a report in compact form for resampling: for each vote, its
+    senator (an index into senators, which are in lis order), its roll call, and
+    whether it betrayed the party or was a futile betrayal. population lists the
+    senators the report ranks, and sort_metric the BOOTSTRAP_METRICS they are ranked by. """
+    def __init__(self, column_stores, only_necessary = False, only_current = False, only_candidates = False, sort = 'pct'):
+        columns = VoteColumns(column_stores)
+        betrayed, futile, necessary = betrayal_flags(columns)
+        keep = necessary[columns.vote_roll_call] if only_necessary else numpy.ones(len(betrayed), dtype=bool)
+        kept_roll_calls = numpy.unique(columns.vote_roll_call[keep])
+        self.roll_call_cnt = len(kept_roll_calls)
+        self.vote_roll_call = numpy.searchsorted(kept_roll_calls, columns.vote_roll_call[keep])
+        self.betrayed = betrayed[keep].astype(numpy.float64)
+        self.futile = futile[keep].astype(numpy.float64)
+
+        order = sorted(range(len(columns.senators)), key=lambda i: columns.senators[i])
+        position = numpy.zeros(len(order), dtype=numpy.int64)
+        position[order] = numpy.arange(len(order))
+        self.senators = [columns.senators[i] for i in order]
+        self.vote_senator = position[columns.vote_senator[keep]]
+
+        registry = senator_registry()
+        voted = set(self.senators[i] for i in numpy.unique(self.vote_senator))
+        self.population = numpy.array([i for i, lis in enumerate(self.senators)
+                                       if lis in voted
+                                       and not (only_candidates and lis not in CANDIDATE_IDS)
+                                       and not (only_current and not registry[lis].current)], dtype=numpy.int64)
+        self.sort_metric = BOOTSTRAP_METRICS.index(sort)
+
+    def metrics(self, weights):
+        """ Array of BOOTSTRAP_METRICS and rank (rows) for each senator (columns),
+        counting each roll call as many times as its weight. Rank is the 1 based
+        position in the report, or 0 for senators outside the population. """
+        size = len(self.senators)
+        vote_weights = weights[self.vote_roll_call]
+        vote_cnt = numpy.bincount(self.vote_senator, weights=vote_weights, minlength=size)
+        betrayal_cnt = numpy.bincount(self.vote_senator, weights=vote_weights * self.betrayed, minlength=size)
+        futile_cnt = numpy.bincount(self.vote_senator, weights=vote_weights * self.futile, minlength=size)
+        total_cnt = betrayal_cnt + futile_cnt
+        # BetrayalCounts gives 0.0 where the division is by zero
+        tot_pct = numpy.where(vote_cnt > 0, total_cnt / numpy.maximum(vote_cnt, 1), 0.0)
+        pct = numpy.where(total_cnt > 0, betrayal_cnt / numpy.maximum(total_cnt, 1), 0.0)
+        metrics = numpy.vstack((vote_cnt, total_cnt, tot_pct, betrayal_cnt, futile_cnt, pct, numpy.zeros(size)))
+        # descending on the sort metric, ties in lis order, as in ranked_senators
+        order = numpy.lexsort((self.population, -metrics[self.sort_metric, self.population]))
+        metrics[-1, self.population[order]] = numpy.arange(1, len(order) + 1)
+        return metrics
+
+    def replicates(self, chunk, seed, replicate_cnt):
+        """ The metrics of replicate_cnt resamples of the roll calls with replacement,
+        drawn from the random state of chunk under seed, as one array. """
+        random = numpy.random.RandomState([seed, chunk])
+        return numpy.array([self.metrics(numpy.bincount(random.randint(0, self.roll_call_cnt, self.roll_call_cnt),
+                                                        minlength=self.roll_call_cnt).astype(numpy.float64))
+                            for i in xrange(replicate_cnt)], dtype=numpy.float32)
+
+_bootstrap_votes = None
+
+def _bootstrap_worker_init(votes):
+    global _bootstrap_votes
+    _bootstrap_votes = votes
+
+def _bootstrap_chunk(task):
+    chunk, seed, replicate_cnt = task
+    return _bootstrap_votes.replicates(chunk, seed, replicate_cnt)
+
+def bootstrap_intervals(votes, replicates = 1000, confidence = 0.95, seed = 0, jobs = 1):
+    """ Returns (estimates, lower, upper) for BootstrapVotes: arrays of the metrics
+    (see BootstrapVotes.metrics) of the roll calls as they are, and the bounds of the
+    percentile intervals of the metrics over replicates resamples. The resamples are
+    drawn in chunks of BOOTSTRAP_CHUNK, spread over jobs worker processes. """
+    tasks = [(chunk, seed, min(BOOTSTRAP_CHUNK, replicates - start))
+             for chunk, start in enumerate(xrange(0, replicates, BOOTSTRAP_CHUNK))]
+    if jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(jobs, _bootstrap_worker_init, (votes,))
+        try:
+            samples = pool.map(_bootstrap_chunk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _bootstrap_worker_init(votes)
+        samples = map(_bootstrap_chunk, tasks)
+    samples = numpy.concatenate(samples)
+    tail = (1 - confidence) / 2 * 100
+    lower, upper = numpy.percentile(samples, [tail, 100 - tail], axis=0)
+    return votes.metrics(numpy.ones(votes.roll_call_cnt)), lower, upper
+
+def calculate_bootstrap(vm, only_necessary = False, only_current = False, only_candidates = False, limit = 20, sort = 'pct',
+                        replicates = 1000, confidence = 0.95, seed = 0, jobs = 1):
+    """ Prints the calculate_betrayal ranking with percentile intervals for rank and
+    every metric, from replicates resamples of the roll calls with replacement. """
+    with Stage('bootstrap') as stage:
+        votes = BootstrapVotes(vm.column_stores, only_necessary, only_current, only_candidates, sort)
+        estimates, lower, upper = bootstrap_intervals(votes, replicates, confidence, seed, jobs)
+        stage.count = replicates
+    registry = senator_registry()
+    if only_necessary:
+        print 'Only considering occasions in which neither party had enough votes to win'
+    print '{:.0f}% intervals from {} resamples of {} roll calls, ranked by {}'.format(confidence * 100, replicates, votes.roll_call_cnt, sort)
+    print 'Rank  Interval  Senator'
+    rank = estimates[-1]
+    for i in sorted(numpy.flatnonzero(rank), key=lambda i: rank[i]):
+        if limit > 0 and rank[i] > limit:
+            break
+        print '{:>4} {:>4.0f}-{:<4.0f}  {}'.format(int(rank[i]), lower[-1, i], upper[-1, i], registry.get_senator_info(votes.senators[i]))
+        print '           ' + '  '.join('{} {:.{precision}f} [{:.{precision}f}, {:.{precision}f}]'.format(
+            metric, estimates[m, i], lower[m, i], upper[m, i], precision=metric.endswith('pct') and 2 or 0)
+            for m, metric in enumerate(BOOTSTRAP_METRICS))
+
+""" Columns of the rows written by the time-series action. """
+TIME_SERIES_FIELDS = ('first_year', 'last_year', 'lis', 'senator', 'vote_cnt', 'betrayal_cnt', 'futile_cnt',
+                      'total_betrayal_cnt', 'total_betrayal_pct', 'success_pct')
+
+def betrayal_time_series(years, window = 2, step = 1, only_necessary = False):
+    """ Counts of every senator in each window of window consecutive calendar years,
+    starting at the first of the years and moving step years at a time. Only the
+    given years are counted.
+
+    Each year's cached aggregates are read once and added up into running totals
+    per senator, so the counts of any window are the difference of two totals.
+    Yields (first_year, last_year, counts), counts being a dictionary of lis to
+    [vote_cnt, betrayal_cnt, futile_cnt] of the senators who voted in the window.
+    """
+    years = sorted(set(int(year) for year in years))
+    first = years[0]
+    span = years[-1] - first + 1
+    totals = {}
+    for year in years:
+        counts = year_aggregates(year)[only_necessary and 'necessary' or 'all']
+        for lis, year_counts in counts.items():
+            if lis not in totals:
+                totals[lis] = [[0, 0, 0] for i in xrange(span + 1)]
+            totals[lis][year - first + 1] = list(year_counts)
+    for lis, senator_totals in totals.items():
+        for i in xrange(1, span + 1):
+            senator_totals[i] = [total + more for total, more in zip(senator_totals[i - 1], senator_totals[i])]
+
+    for start in xrange(0, span - window + 1, step):
+        counts = {}
+        for lis, senator_totals in totals.items():
+            window_counts = [end - begin for begin, end in zip(senator_totals[start], senator_totals[start + window])]
+            if window_counts[0]:
+                counts[lis] = window_counts
+        yield first + start, first + start + window - 1, counts
+
+def time_series_rows(years, window = 2, step = 1, only_necessary = False, only_current = False, only_candidates = False):
+    """ Long format rows of TIME_SERIES_FIELDS for each senator in each window of
+    betrayal_time_series, ordered by window and lis. """
+    for first_year, last_year, counts in betrayal_time_series(years, window, step, only_necessary):
+        for senator in sorted(tally_senators(counts), key=lambda x: x.lis):
+            if only_candidates and senator.lis not in CANDIDATE_IDS:
+                continue
+            if only_current and not senator.current:
+                continue
+            yield {
+                'first_year': first_year,
+                'last_year': last_year,
+                'lis': senator.lis,
+                'senator': str(senator),
+                'vote_cnt': senator.vote_cnt,
+                'betrayal_cnt': senator.betrayal_cnt,
+                'futile_cnt': senator.futile_cnt,
+                'total_betrayal_cnt': senator.total_betrayal_cnt,
+                'total_betrayal_pct': senator.total_betrayal_pct,
+                'success_pct': senator.success_pct,
+            }
+
+def write_time_series(rows, out, output_format = 'csv'):
+    """ Writes time_series_rows to the file out as csv or as a json list. """
+    if output_format == 'json':
+        json.dump(list(rows), out, indent=1, sort_keys=True)
+        out.write('\n')
+    else:
+        writer = csv.DictWriter(out, TIME_SERIES_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
 
 def resolution_hist(vm):
     """ Exploratory histogram """
@@ -448,10 +1509,9 @@ def betrayal_hist(vm):
     print 'Hist of number of betraying votes'
     betrayal_ctr = Counter()
     for roll_call in vm.roll_calls:
-        betrayals = len([vote for vote in roll_call.votes if vote.betrayed_party])
-        betrayal_ctr[betrayals] += 1
-        if betrayals > 30:
-            print roll_call.vote_id
+        betrayal_ctr[roll_call.betrayal_cnt] += 1
+        if roll_call.betrayal_cnt > 30:
+            print roll_call.roll_call_id
     for betrayal_quantity, betrayal_quantity_occurences in betrayal_ctr.most_common():
         print betrayal_quantity, betrayal_quantity_occurences
 
@@ -463,104 +1523,1478 @@ def calculate_session(year):
     # Sessions start in 1789 and last two years
     return (int(year) + 1)/2 - 894, (int(year) % 2) and 1 or 2
 
-def load_year(year):
+def load_year(year, parser='stream', fetcher=None):
     """ Builds new pickled roll call data
 
     First, it rsyncs the json data from govtrack.us to data/{year}/
     Second, it builds the roll_calls
     Third, it pickles them all in data/{}/roll_calls.pickle
+
+    Parameters:
+    parser: key of PARSERS used to build each roll call
+    fetcher: Fetcher used to download; a default one if None
     """
-    if int(year) < 1989:
-        print 'This code does not work with data before 1989'
+    for loaded_year, roll_calls in load_years([year], parser, fetcher=fetcher):
+        return roll_calls
+
+def load_years(years, parser='stream', jobs=1, fetcher=None):
+    """ Does the work of load_year for several years, yielding (year, roll_calls)
+    as each year is pickled.
+
+    Every year is downloaded first; then the roll call xml files of all the years
+    are parsed as one stream of work, spread over jobs worker processes. Roll calls
+    are kept in file name order, so the same roll calls are saved in the same order
+    for any number of jobs (the pickles may still differ byte for byte, as roll calls
+    parsed in workers no longer share their strings).
+    Roll calls whose result cannot be classified are quarantined (see save_roll_calls)
+    rather than stopping the load.
+
+    Parameters:
+    parser: key of PARSERS used to build each roll call
+    jobs: number of worker processes used for parsing
+    fetcher: Fetcher used to download; a default one if None
+    """
+    fetcher = fetcher or Fetcher()
+    year_paths = []
+    for year in years:
+        with Stage('download', year) as stage:
+            stage.count = len(download_year(year, fetcher))
+        year_paths.append((year, roll_call_paths(year)))
+    tasks = [(file_path, parser) for year, paths in year_paths for file_path in paths]
+
+    results = parse_files(tasks, jobs)
+    try:
+        for year, paths in year_paths:
+            with Stage('parse', year) as stage:
+                year_results = list(itertools.islice(results, len(paths)))
+                stage.count = len(year_results)
+            yield year, save_loaded_year(year, paths, year_results)
+    finally:
+        results.close()
+
+def save_loaded_year(year, paths, results):
+    """ Saves a year loaded by load_years or load_years_pipelined from the xml files at
+    paths, given their load_roll_call_file results, and returns its roll calls.
+    Exits if the year has no roll calls at all. """
+    if not paths:
+        print "Something wrong: no roll_calls for {}".format(year)
         sys.exit(1)
+    roll_calls, vote_numbers, quarantine = split_quarantine(paths, results)
+    if quarantine:
+        print 'Quarantined {} roll calls of {} with unclassifiable results; see data/rollcalls/{}/{}'.format(
+            len(quarantine), year, year, CLASSIFICATION)
+    with Stage('save', year) as stage:
+        save_roll_calls(year, roll_calls, vote_numbers, quarantine)
+        stage.count = len(roll_calls)
+    return roll_calls
+
+def parse_files(tasks, jobs=1):
+    """ Yields the load_roll_call_file result of each (file path, parser) of tasks, in
+    order, spread over jobs worker processes when there are several tasks. The workers
+    are stopped once the results have all been read, or as soon as the generator is
+    closed or fails. """
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield load_roll_call_file(task)
+        return
+    pool = multiprocessing.Pool(jobs)
+    finished = False
+    try:
+        for result in pool.imap(load_roll_call_file, tasks, max(1, len(tasks) // (jobs * 4))):
+            yield result
+        finished = True
+    finally:
+        if finished:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+
+def load_years_pipelined(years, parser='stream', jobs=1, fetcher=None, depth=PIPELINE_DEPTH):
+    """ load_years with downloading, parsing and saving overlapped, so that a cold load
+    takes about as long as the slower of the network and the parsing rather than both.
+
+    A thread downloads the menu of each year in turn and queues its roll call files;
+    fetcher.jobs threads download them, and pass each file on once it is on disk. The
+    calling thread parses the files as they arrive (or hands them to jobs worker
+    processes) and saves each year as soon as all of its files are parsed. Every queue
+    holds at most depth files, so a fast network waits for the parsing rather than
+    piling up work ahead of it.
+
+    Yields (year, roll_calls) in the order of years, with the same stores as load_years.
+    """
+    fetcher = fetcher or Fetcher()
+    years = list(years)
+    downloads = Queue.Queue(depth)
+    events = Queue.Queue(depth)
+    stop = threading.Event()
+
+    def put(queue, item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def read_menus():
+        try:
+            for year in years:
+                with Stage('download-menu', year) as stage:
+                    vote_numbers, year_downloads = menu_downloads(year, fetcher)
+                    stage.count = len(vote_numbers)
+                urls = dict((path, url) for url, path in year_downloads)
+                paths = sorted(set(roll_call_paths(year)).union(urls))
+                put(events, ('year', year, paths))
+                for path in paths:
+                    put(downloads, (year, path, urls.get(path)))
+        except Exception:
+            put(events, ('error', sys.exc_info()))
+        finally:
+            for i in xrange(fetcher.jobs):
+                put(downloads, None)
+
+    def download():
+        try:
+            while not stop.is_set():
+                try:
+                    item = downloads.get(timeout=0.1)
+                except Queue.Empty:
+                    continue
+                if item is None:
+                    break
+                year, path, url = item
+                if url:
+                    fetcher.fetch(url, path)
+                put(events, ('file', year, path))
+        except Exception:
+            put(events, ('error', sys.exc_info()))
 
+    threads = [threading.Thread(target=read_menus)] + [threading.Thread(target=download) for i in xrange(fetcher.jobs)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    pool = jobs > 1 and multiprocessing.Pool(jobs) or None
+    pending = deque()
+    year_paths = {}
+    year_results = defaultdict(dict)
+    try:
+        with Stage('pipeline') as stage:
+            stage.count = 0
+            position = 0
+            while position < len(years):
+                if pending and (len(pending) >= depth or pending[0][2].ready()):
+                    year, path, result = pending.popleft()
+                    year_results[year][path] = result.get()
+                elif pending and events.empty():
+                    pending[0][2].wait(0.05)
+                    continue
+                else:
+                    event = events.get()
+                    if event[0] == 'error':
+                        error_type, error, traceback = event[1]
+                        raise error_type, error, traceback
+                    elif event[0] == 'year':
+                        year_paths[event[1]] = event[2]
+                    elif pool:
+                        pending.append((event[1], event[2], pool.apply_async(load_roll_call_file, [(event[2], parser)])))
+                        continue
+                    else:
+                        year_results[event[1]][event[2]] = load_roll_call_file((event[2], parser))
+
+                while position < len(years) and len(year_results[years[position]]) == len(year_paths.get(years[position], [None])):
+                    year = years[position]
+                    paths = year_paths.pop(year)
+                    results = year_results.pop(year)
+                    roll_calls = save_loaded_year(year, paths, [results[path] for path in paths])
+                    stage.count += len(roll_calls)
+                    position += 1
+                    yield year, roll_calls
+    except:
+        if pool:
+            pool.terminate()
+            pool = None
+        raise
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        if pool:
+            pool.close()
+            pool.join()
+
+def append_year(year, parser='stream', jobs=1, fetcher=None):
+    """ Brings the store of a year up to date with its menu, downloading and parsing
+    only the roll calls that are not in it yet. They are saved as a new segment of the
+    store and added into its aggregates, so the cost grows with the number of new
+    roll calls rather than with the size of the year. The menu is always checked for
+    changes (costing one 304 response if there are none), so that votes held late in
+    a year that has since ended are found.
+
+    Falls back to load_year when there is no store to append to, or when the xml files
+    or classification tables it was built from have changed since.
+
+    Returns the roll calls that were added.
+    """
+    aggregates = read_aggregates(year)
+    if not store_current(year, aggregates, added=True):
+        return load_year(year, parser, fetcher)
+
+    stored = set(aggregate_files(aggregates))
+    with Stage('download', year) as stage:
+        vote_numbers = [vote_number for vote_number in download_year(year, fetcher, refresh=True) if vote_number not in stored]
+        stage.count = len(vote_numbers)
+    if not vote_numbers:
+        return []
+    tasks = [('data/rollcalls/{}/{}.xml'.format(year, vote_number), parser) for vote_number in vote_numbers]
+    with Stage('parse', year) as stage:
+        results = list(parse_files(tasks, jobs))
+        roll_calls, vote_numbers, quarantine = split_quarantine([task[0] for task in tasks], results)
+        stage.count = len(roll_calls)
+
+    index = None
+    if os.path.exists("data/rollcalls/{}/{}".format(year, SENATOR_INDEX)):
+        index = SenatorIndex(year)
+        index = index.matches(aggregates) and index or None
+    with Stage('save', year) as stage:
+        segment = max(aggregates['segments'] or [0]) + 1
+        pickle_path, columns_path = year_store_parts(year, [segment])[-1]
+        with atomic_open(pickle_path) as f:
+            pickle.dump(roll_calls, f, pickle.HIGHEST_PROTOCOL)
+        if numpy is not None:
+            save_columns(columns_path, roll_calls)
+        add_counts(aggregates['all'], count_betrayals(roll_calls))
+        add_counts(aggregates['necessary'], count_betrayals(roll_calls, True))
+        aggregates['vote_numbers'] = sorted(aggregates['vote_numbers'] + vote_numbers)
+        aggregates['quarantine'] = sorted(aggregates.get('quarantine', []) + [record['vote_number'] for record in quarantine])
+        aggregates['segments'] = aggregates['segments'] + [segment]
+        manifest = read_manifest(year)
+        manifest = save_manifest(year, manifest['order'] + vote_numbers,
+                                 manifest['quarantine'] + [record['vote_number'] for record in quarantine], manifest['files'])
+        save_aggregates(year, aggregates, manifest)
+        classification = read_classification(year)
+        save_classification(year, roll_calls, quarantine, classification)
+        if index:
+            entries = defaultdict(list, index.all_entries())
+            save_senator_index(year, aggregates, senator_index_entries(roll_calls, len(aggregates['segments']), entries))
+        stage.count = len(roll_calls)
+    return roll_calls
+
+def download_year(year, fetcher = None, refresh = False):
+    """ Downloads the menu and every roll call xml file of a year that is not already
+    in data/rollcalls/{year}/. The menu of the current year, or of any year if refresh
+    is set, is checked for changes on every call, so that newly held votes are picked
+    up. Returns the vote numbers listed in the menu.
+
+    Parameters:
+    fetcher: Fetcher used to download; a default one if None
+    refresh: check the menu for changes even if the year is over
+    """
+    fetcher = fetcher or Fetcher()
+    vote_numbers, downloads = menu_downloads(year, fetcher, refresh)
+    fetcher.fetch_all(downloads)
+    return vote_numbers
+
+def menu_downloads(year, fetcher, refresh = False):
+    """ Downloads the menu of a year as download_year does. Returns the vote numbers
+    listed in it, and the (url, path) of each roll call xml file still to download. """
     session, subsession = calculate_session(year)
     try:
         os.makedirs('data/rollcalls/{}'.format(year))
     except OSError:
         pass
-    opener = urllib2.build_opener()
-    opener.addheaders = [('User-Agent', 'Mozilla/5.0')]
     menu_path = 'data/rollcalls/{}/menu.xml'.format(year)
-    if not os.path.exists(menu_path):
-        print 'downloading', year
-        url = 'https://www.senate.gov/legislative/LIS/roll_call_lists/vote_menu_{}_{}.xml'.format(session, subsession)
-        with open(menu_path, 'wb') as f:
-            for l in opener.open(url):
-                f.write(l)
+    if refresh or not os.path.exists(menu_path) or int(year) >= date.today().year:
+        url = MENU_URL.format(base=fetcher.base_url, session=session, subsession=subsession)
+        fetcher.fetch(url, menu_path, conditional=True)
     menu = parse(menu_path)
-    for cnt, vote_number_node in enumerate(menu.getElementsByTagName('vote_number')):
+    vote_numbers = []
+    downloads = []
+    for vote_number_node in menu.getElementsByTagName('vote_number'):
         vote_number = text_value(vote_number_node)
+        vote_numbers.append(vote_number)
         vote_number_path = 'data/rollcalls/{}/{}.xml'.format(year, vote_number)
         try:
             exists = os.stat(vote_number_path).st_size
         except OSError:
             exists = False
         if not exists:
-            if not cnt % 3:
-                sleep(2)
-            url = 'https://www.senate.gov/legislative/LIS/roll_call_votes/vote{session}{subsession}/vote_{session}_{subsession}_{vote_number}.xml'.format(session=session, subsession=subsession, vote_number=vote_number)
-            print 'downloading', url
-            with open(vote_number_path, 'wb') as f:
-                for l in opener.open(url):
-                    f.write(l)
-        
-    roll_calls = []
+            url = VOTE_URL.format(base=fetcher.base_url, session=session, subsession=subsession, vote_number=vote_number)
+            downloads.append((url, vote_number_path))
+    return vote_numbers, downloads
+
+class FetchError(IOError):
+    pass
+
+class StaleStoreError(IOError):
+    """ Raised when the store of a year is out of date with its xml files or the
+    classification tables, and would have to be rebuilt to be reported on. """
+    def __init__(self, year):
+        IOError.__init__(self, 'The store of {} is out of date with its files; run --action rebuild'.format(year))
+        self.year = year
+
+class TokenBucket(object):
+    """ Thread safe rate limiter: acquire() blocks so that on average no more than rate
+    calls a second get through, with bursts of up to burst calls. """
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+class Fetcher(object):
+    """ Downloads files for load_year and load_senators.
+
+    Up to jobs files are downloaded at once, each thread keeping its connection to a
+    host open between requests, and no more than rate requests a second are started
+    (0 for no limit). Connection errors, 429 and 5xx responses are retried up to
+    retries times, waiting backoff seconds and doubling the wait each time, or as long
+    as a Retry-After header asks. Files are written to a temporary file and moved into
+    place once complete, so an interrupted download never leaves a truncated file
+    behind; a body shorter than its Content-Length counts as a connection error.
+
+    Attributes:
+    base_url: where senate.gov roll call files are downloaded from
+    legislators_url: where the congress-legislators yaml files are downloaded from
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+    MAX_REDIRECTS = 5
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, jobs = 4, rate = 1.5, retries = 4, backoff = 1.0, timeout = 60, base_url = SENATE_URL,
+                 legislators_url = LEGISLATORS_URL):
+        self.jobs = max(1, jobs)
+        self.bucket = rate and TokenBucket(rate, self.jobs) or None
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.base_url = base_url.rstrip('/')
+        self.legislators_url = legislators_url.rstrip('/')
+        self.print_lock = threading.Lock()
+        self.local = threading.local()
+
+    def fetch_all(self, downloads, conditional = False):
+        """ Fetches every (url, path) of downloads, jobs at a time. Raises the first
+        error once every download has finished or failed. """
+        work = Queue.Queue()
+        for download in downloads:
+            work.put(download)
+        errors = []
+        def worker():
+            while True:
+                try:
+                    url, path = work.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    self.fetch(url, path, conditional)
+                except Exception:
+                    errors.append(sys.exc_info())
+        threads = [threading.Thread(target=worker) for i in xrange(min(self.jobs, work.qsize()))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+        if errors:
+            error_type, error, traceback = errors[0]
+            raise error_type, error, traceback
+
+    def fetch(self, url, path, conditional = False):
+        """ Downloads url to path. If conditional, the validators the server sends are
+        kept in path.headers, and if path was downloaded before, the server is asked to
+        send it only if it has changed since. Returns whether path was written. """
+        validators_path = '{}.headers'.format(path)
+        headers = {}
+        if conditional and os.path.exists(path) and os.path.exists(validators_path):
+            with open(validators_path, 'rb') as f:
+                validators = json.load(f)
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last-modified'):
+                headers['If-Modified-Since'] = validators['last-modified']
+
+        for attempt in xrange(self.retries + 1):
+            try:
+                response = self._request(url, headers)
+                if response.status == 304:
+                    response.read()
+                    return False
+                if response.status != 200:
+                    response.read()
+                    error = FetchError('{} returned {} {}'.format(url, response.status, response.reason))
+                    if response.status not in self.RETRY_STATUSES or attempt == self.retries:
+                        raise error
+                    self._wait(attempt, response.getheader('retry-after'))
+                    continue
+                with self.print_lock:
+                    print 'downloading', url
+                with atomic_open(path) as f:
+                    size = 0
+                    while True:
+                        chunk = response.read(self.CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        size += len(chunk)
+                    length = response.getheader('content-length')
+                    if length and length.isdigit() and size != int(length):
+                        raise httplib.IncompleteRead('', int(length) - size)
+                if conditional and (response.getheader('etag') or response.getheader('last-modified')):
+                    with atomic_open(validators_path) as f:
+                        json.dump({'etag': response.getheader('etag'),
+                                   'last-modified': response.getheader('last-modified')}, f)
+                return True
+            except (socket.error, httplib.HTTPException):
+                self._drop_connections()
+                if attempt == self.retries:
+                    raise
+                self._wait(attempt)
+
+    def _wait(self, attempt, retry_after = None):
+        try:
+            wait = float(retry_after)
+        except (TypeError, ValueError):
+            wait = self.backoff * 2 ** attempt
+        sleep(wait)
+
+    def _request(self, url, headers):
+        """ Sends a GET for url over this thread's connection to its host, following
+        redirects, and returns the response. """
+        for redirect in xrange(self.MAX_REDIRECTS + 1):
+            if self.bucket:
+                self.bucket.acquire()
+            parts = urlparse.urlsplit(url)
+            connection = self._connection(parts.scheme, parts.netloc)
+            request_path = parts.path or '/'
+            if parts.query:
+                request_path = '{}?{}'.format(request_path, parts.query)
+            request_headers = {'User-Agent': 'Mozilla/5.0'}
+            request_headers.update(headers)
+            connection.request('GET', request_path, headers=request_headers)
+            response = connection.getresponse()
+            if response.status not in self.REDIRECT_STATUSES:
+                return response
+            response.read()
+            url = urlparse.urljoin(url, response.getheader('location'))
+        raise FetchError('Too many redirects for {}'.format(url))
+
+    def _connection(self, scheme, host):
+        connections = self.local.__dict__.setdefault('connections', {})
+        if (scheme, host) not in connections:
+            connection_class = scheme == 'https' and httplib.HTTPSConnection or httplib.HTTPConnection
+            connections[(scheme, host)] = connection_class(host, timeout=self.timeout)
+        return connections[(scheme, host)]
+
+    def _drop_connections(self):
+        connections = self.local.__dict__.setdefault('connections', {})
+        for key in connections.keys():
+            connections.pop(key).close()
+
+def roll_call_paths(year):
+    """ Paths of the downloaded roll call xml files of a year, sorted by file name. """
+    paths = []
     for root, dirs, files in os.walk("data/rollcalls/{}".format(year)):
         for filename in files:
             if filename == 'menu.xml':
                 continue
             if filename.endswith('xml'):
-                file_path = '{}/{}'.format(root, filename)
-                with open(file_path, 'rb') as f:
-                    try:
-                        roll_calls.append(RollCall(parse(f)))
-                    except:
-                        print 'Error in {}'.format(file_path)
-                        raise
-
-    if roll_calls:
-        with open("data/rollcalls/{}/{}".format(year, ROLL_CALLS_PICKLE), 'wb') as f:
-            pickle.dump(roll_calls, f)
-        return roll_calls
+                paths.append('{}/{}'.format(root, filename))
+    return sorted(paths)
+
+def parse_roll_call_file(task):
+    """ Builds the RollCall for a (file_path, parser) pair. Lives at module level
+    so that it can be handed to worker processes. """
+    file_path, parser = task
+    with open(file_path, 'rb') as f:
+        try:
+            return PARSERS[parser](f)
+        except UnknownResultError:
+            raise
+        except:
+            print 'Error in {}'.format(file_path)
+            raise
+
+def load_roll_call_file(task):
+    """ parse_roll_call_file for loading a store: returns (roll call, None), or
+    (None, quarantine record) for a roll call whose result could not be classified,
+    the record being a dictionary of its vote_number, vote_result, vote_result_text
+    and error. """
+    try:
+        return parse_roll_call_file(task), None
+    except UnknownResultError as e:
+        return None, {'vote_number': vote_number_from_path(task[0]), 'vote_result': e.result,
+                      'vote_result_text': e.result_text, 'error': str(e)}
+
+def split_quarantine(paths, results):
+    """ (roll calls, their vote numbers, quarantine records) from the load_roll_call_file
+    results of the files at paths. """
+    roll_calls, vote_numbers, quarantine = [], [], []
+    for file_path, (roll_call, record) in zip(paths, results):
+        if roll_call is None:
+            quarantine.append(record)
+        else:
+            roll_calls.append(roll_call)
+            vote_numbers.append(vote_number_from_path(file_path))
+    return roll_calls, vote_numbers, quarantine
+
+def vote_number_from_path(file_path):
+    return os.path.basename(file_path)[:-len('.xml')]
+
+def save_roll_calls(year, roll_calls, vote_numbers, quarantine = ()):
+    """ Saves the roll calls of a year, built from the xml files of vote_numbers, as its
+    complete store, replacing any segments added by append_year. quarantine holds the
+    load_roll_call_file records of the files whose result could not be classified.
+
+    data/{year}/roll_calls.pickle: the roll calls
+    data/{year}/columns/: the roll calls in columnar form, if numpy is available
+    data/{year}/aggregates.pickle: a dictionary with the count_betrayals of all the
+    roll calls under 'all' and of those in which betrayal was necessary under
+    'necessary', the stored 'vote_numbers', the vote numbers in 'quarantine', the
+    numbers of the 'segments' appended since, and the manifest_fingerprint of the
+    manifest. It is what marks a segment as part of the store.
+    data/{year}/senators.index: the SenatorIndex of the roll calls
+    data/{year}/manifest.json: what the store was built from (see save_manifest)
+    data/{year}/classification.json: see save_classification
+    """
+    year_path = "data/rollcalls/{}".format(year)
+    with atomic_open(os.path.join(year_path, ROLL_CALLS_PICKLE)) as f:
+        pickle.dump(roll_calls, f, pickle.HIGHEST_PROTOCOL)
+    if numpy is not None:
+        save_columns(os.path.join(year_path, ROLL_CALL_COLUMNS), roll_calls)
+    aggregates = {
+        'vote_numbers': sorted(vote_numbers),
+        'quarantine': sorted(record['vote_number'] for record in quarantine),
+        'segments': [],
+        'all': dict(count_betrayals(roll_calls)),
+        'necessary': dict(count_betrayals(roll_calls, True)),
+    }
+    save_aggregates(year, aggregates, save_manifest(year, vote_numbers, aggregates['quarantine']))
+    save_senator_index(year, aggregates, senator_index_entries(roll_calls))
+    save_classification(year, roll_calls, quarantine)
+    for filename in os.listdir(year_path):
+        if SEGMENT_NAME.match(filename):
+            if os.path.isdir(os.path.join(year_path, filename)):
+                shutil.rmtree(os.path.join(year_path, filename))
+            else:
+                os.remove(os.path.join(year_path, filename))
+
+def file_record(path):
+    """ [size, mtime, sha1 of the content] of a file, as kept in manifests. """
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return [stat.st_size, stat.st_mtime, digest]
+
+def save_manifest(year, vote_numbers, quarantine = (), records = None):
+    """ Saves data/{year}/manifest.json, recording what the store of a year was built
+    from: the STORE_VERSION, the classification_fingerprint, the vote numbers of its
+    roll calls in store order, those of the quarantined roll calls, and the
+    file_record of each of their xml files. records, a dictionary of vote number to
+    file_record, gives those already known, so that only the other files are hashed.
+    Returns the manifest. """
+    records = records or {}
+    manifest = {
+        'version': STORE_VERSION,
+        'classification': classification_fingerprint(),
+        'order': list(vote_numbers),
+        'quarantine': list(quarantine),
+        'files': dict((vote_number, records.get(vote_number) or file_record('data/rollcalls/{}/{}.xml'.format(year, vote_number)))
+                      for vote_number in list(vote_numbers) + list(quarantine)),
+    }
+    with atomic_open("data/rollcalls/{}/{}".format(year, MANIFEST)) as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    return manifest
+
+def refresh_manifest(year, manifest, touched):
+    """ Records the current size and time of the touched files (see year_changes) in
+    the manifest of a year, their content being unchanged. """
+    if not touched:
+        return
+    for vote_number in touched:
+        stat = os.stat('data/rollcalls/{}/{}.xml'.format(year, vote_number))
+        manifest['files'][vote_number] = [stat.st_size, stat.st_mtime, manifest['files'][vote_number][2]]
+    with atomic_open("data/rollcalls/{}/{}".format(year, MANIFEST)) as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+
+def manifest_fingerprint(manifest):
+    """ Digest of what a manifest says its store was built from. The sizes and times
+    of the files are left out, so that a file downloaded again unchanged keeps it. """
+    return hashlib.sha1(json.dumps([manifest['version'], manifest['classification'], manifest['order'], manifest['quarantine'],
+                                    sorted((vote_number, record[2]) for vote_number, record in manifest['files'].items())])).hexdigest()
+
+def read_manifest(year):
+    path = "data/rollcalls/{}/{}".format(year, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return json.load(f)
+
+def save_classification(year, roll_calls, quarantine, previous = None):
+    """ Saves data/{year}/classification.json: 'stats', the number of roll calls
+    classified by each of CLASSIFICATION_METHODS and the number 'quarantined', and
+    'quarantine', the load_roll_call_file records of the quarantined roll calls. The
+    roll calls and quarantine are added to those of previous, if given. """
+    classification = previous or {'stats': dict((name, 0) for name in CLASSIFICATION_METHODS + ('quarantined',)),
+                                  'quarantine': []}
+    for roll_call in roll_calls:
+        method = roll_call.classified_by or 'unknown'
+        classification['stats'][method] = classification['stats'].get(method, 0) + 1
+    classification['stats']['quarantined'] += len(quarantine)
+    classification['quarantine'] = classification['quarantine'] + list(quarantine)
+    with atomic_open("data/rollcalls/{}/{}".format(year, CLASSIFICATION)) as f:
+        json.dump(classification, f, indent=1, sort_keys=True)
+
+def read_classification(year):
+    path = "data/rollcalls/{}/{}".format(year, CLASSIFICATION)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return json.load(f)
+
+def classification_report(years):
+    """ Prints the classification statistics of the years, and the quarantined roll calls. """
+    print '  Year ' + ' '.join('{:>11}'.format(name) for name in CLASSIFICATION_METHODS + ('quarantined',))
+    quarantine = []
+    for year in years:
+        classification = read_classification(year)
+        if classification is None:
+            print '{:>6} not loaded by this version'.format(year)
+            continue
+        print '{:>6} '.format(year) + ' '.join('{:>11}'.format(classification['stats'].get(name, 0))
+                                              for name in CLASSIFICATION_METHODS + ('quarantined',))
+        quarantine.extend((year, record) for record in classification['quarantine'])
+    for year, record in quarantine:
+        print 'Quarantined {} {}: {}'.format(year, record['vote_number'], record['error'])
+
+def year_changes(year):
+    """ How the downloaded xml files of a year differ from the manifest of its store,
+    as a dictionary of lists of vote numbers: 'changed' (content differs), 'added',
+    'removed' and 'touched' (size or time differ but the content does not), and of
+    'stale', a reason to rebuild the whole store or None. Content is only hashed for
+    files whose size or time differ from the manifest. """
+    changes = dict((name, []) for name in ('changed', 'added', 'removed', 'touched'))
+    manifest = read_manifest(year)
+    vote_numbers = [vote_number_from_path(path) for path in roll_call_paths(year)]
+    if not os.path.exists("data/rollcalls/{}/{}".format(year, ROLL_CALLS_PICKLE)):
+        changes['stale'] = 'not loaded'
+    elif manifest is None:
+        changes['stale'] = 'no manifest'
+    elif manifest['version'] != STORE_VERSION:
+        changes['stale'] = 'store version changed'
+    elif manifest['classification'] != classification_fingerprint():
+        changes['stale'] = 'classification tables changed'
     else:
+        changes['stale'] = None
+    if manifest is None:
+        changes['added'] = vote_numbers
+        return changes
+    files = manifest['files']
+    for vote_number in vote_numbers:
+        if vote_number not in files:
+            changes['added'].append(vote_number)
+            continue
+        size, mtime, digest = files[vote_number]
+        stat = os.stat('data/rollcalls/{}/{}.xml'.format(year, vote_number))
+        if stat.st_size == size and stat.st_mtime == mtime:
+            continue
+        if file_record('data/rollcalls/{}/{}.xml'.format(year, vote_number))[2] == digest:
+            changes['touched'].append(vote_number)
+        else:
+            changes['changed'].append(vote_number)
+    on_disk = set(vote_numbers)
+    changes['removed'] = sorted(vote_number for vote_number in files if vote_number not in on_disk)
+    return changes
+
+def rebuild_year(year, parser = 'stream', jobs = 1, changes = None):
+    """ Brings the store of a year up to date with its downloaded xml files (see
+    year_changes), parsing again only the roll calls whose files were changed or
+    added, spread over jobs worker processes, unless the whole store is stale. The
+    other roll calls are taken from the store, and everything is saved again as a
+    complete store with save_roll_calls. Returns the number of roll calls parsed,
+    or None if the store was already up to date (files only touched are recorded
+    in the manifest without saving the store again). """
+    changes = changes or year_changes(year)
+    if not changes['stale'] and not any(changes[name] for name in ('changed', 'added', 'removed')):
+        if changes['touched']:
+            refresh_manifest(year, read_manifest(year), changes['touched'])
+        return None
+    stored = {}
+    if not changes['stale']:
+        stored = dict(zip(read_manifest(year)['order'], load_roll_calls(year)))
+    reparse = set(changes['changed'])
+    vote_numbers = [vote_number_from_path(path) for path in roll_call_paths(year)]
+    tasks = [('data/rollcalls/{}/{}.xml'.format(year, vote_number), parser)
+             for vote_number in vote_numbers if vote_number not in stored or vote_number in reparse]
+    with Stage('parse', year) as stage:
+        results = list(parse_files(tasks, jobs))
+        stage.count = len(results)
+    parsed = dict((vote_number_from_path(file_path), result) for (file_path, parser), result in zip(tasks, results))
+    roll_calls, stored_numbers, quarantine = split_quarantine(
+        ['{}.xml'.format(vote_number) for vote_number in vote_numbers],
+        [parsed.get(vote_number) or (stored[vote_number], None) for vote_number in vote_numbers])
+    if not vote_numbers:
         print "Something wrong: no roll_calls for {}".format(year)
         sys.exit(1)
+    with Stage('save', year) as stage:
+        save_roll_calls(year, roll_calls, stored_numbers, quarantine)
+        stage.count = len(roll_calls)
+    return len(results)
+
+def senators_changed():
+    """ Whether the legislators yaml files differ from those the saved senators were
+    built from, according to data/legislators/manifest.json. """
+    path = "data/legislators/{}".format(MANIFEST)
+    if not os.path.exists(path) or not os.path.exists("data/legislators/{}".format(LEGISLATORS_REGISTRY)):
+        return True
+    with open(path, 'rb') as f:
+        manifest = json.load(f)
+    for filename, (size, mtime, digest) in manifest['files'].items():
+        file_path = os.path.join('data/legislators', filename)
+        if not os.path.exists(file_path):
+            return True
+        stat = os.stat(file_path)
+        if (stat.st_size != size or stat.st_mtime != mtime) and file_record(file_path)[2] != digest:
+            return True
+    return False
+
+def verify_years(years, rebuild = False, parser = 'stream', jobs = 1):
+    """ Prints how the stores of the years and the saved senators differ from the
+    files they were built from, rebuilding them if rebuild is set. Returns whether
+    everything was (or now is) up to date. """
+    up_to_date = True
+    if senators_changed():
+        up_to_date = False
+        print 'Senators: legislators files changed'
+        if rebuild:
+            load_senators(False)
+            print 'Senators: rebuilt'
+    for year in years:
+        changes = year_changes(year)
+        counts = ', '.join('{} {}'.format(len(changes[name]), name) for name in ('changed', 'added', 'removed', 'touched'))
+        if changes['stale']:
+            print '{}: {}, {}'.format(year, changes['stale'], counts)
+        elif any(changes[name] for name in ('changed', 'added', 'removed')):
+            print '{}: {}'.format(year, counts)
+        elif changes['touched']:
+            refresh_manifest(year, read_manifest(year), changes['touched'])
+            print '{}: up to date, {} touched'.format(year, len(changes['touched']))
+            continue
+        else:
+            print '{}: up to date'.format(year)
+            continue
+        up_to_date = False
+        if rebuild:
+            parsed = rebuild_year(year, parser, jobs, changes)
+            print '{}: rebuilt, {} roll calls parsed'.format(year, parsed)
+    return up_to_date or rebuild
+
+def year_store_parts(year, segments = None):
+    """ (pickle path, columns path) of each part of the store of a year: first the
+    roll calls saved by load_year, then those added by each append_year. segments
+    defaults to the segments recorded in the aggregates of the year. """
+    if segments is None:
+        aggregates = read_aggregates(year)
+        segments = aggregates and aggregates.get('segments') or []
+    year_path = "data/rollcalls/{}".format(year)
+    parts = [(os.path.join(year_path, ROLL_CALLS_PICKLE), os.path.join(year_path, ROLL_CALL_COLUMNS))]
+    for segment in segments:
+        parts.append((os.path.join(year_path, SEGMENT_PICKLE.format(segment)),
+                      os.path.join(year_path, SEGMENT_COLUMNS.format(segment))))
+    return parts
+
+def load_roll_calls(year):
+    """ The pickled roll calls of a year, including those added by append_year. """
+    roll_calls = []
+    with Stage('unpickle', year) as stage:
+        for pickle_path, columns_path in year_store_parts(year):
+            with open(pickle_path, 'rb') as f:
+                roll_calls.extend(pickle.load(f))
+        stage.count = len(roll_calls)
+    return roll_calls
+
+def senator_index_entries(roll_calls, part = 0, entries = None):
+    """ Adds the votes of the roll calls of a part of a year's store (see
+    year_store_parts) to entries, a dictionary of lis to a list of
+    (part, roll call position, vote position, betrayed_party, futile_betrayal,
+    betrayal_necessary) tuples, the flags being 1 or 0. Returns entries. """
+    entries = entries if entries is not None else defaultdict(list)
+    for roll_call_position, roll_call in enumerate(roll_calls):
+        necessary = int(roll_call.betrayal_necessary)
+        for vote_position, vote in enumerate(roll_call.votes):
+            entries[vote.senator_id].append((part, roll_call_position, vote_position,
+                                             int(vote.betrayed_party), int(vote.futile_betrayal), necessary))
+    return entries
+
+def save_senator_index(year, aggregates, entries):
+    """ Saves the SenatorIndex of a year, built from the store described by its
+    aggregates, in data/{year}/senators.index.
+
+    The file holds the length of a marshalled header, the header -- (version,
+    fingerprint and segments of the aggregates, dictionary of lis to (offset, length)
+    of its entries) -- and then the marshalled entries of each senator, so that the
+    entries of one senator can be read without reading those of the others.
+    """
+    header = {}
+    bodies = []
+    offset = 0
+    for lis, senator_entries in sorted(entries.items()):
+        body = marshal.dumps(list(senator_entries))
+        header[lis] = (offset, len(body))
+        offset += len(body)
+        bodies.append(body)
+    header = marshal.dumps((SenatorIndex.VERSION, aggregates['fingerprint'], list(aggregates['segments']), header))
+    with atomic_open("data/rollcalls/{}/{}".format(year, SENATOR_INDEX)) as f:
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for body in bodies:
+            f.write(body)
+
+class SenatorIndex(object):
+    """ Inverted index of a year's store from senator lis to the positions and
+    betrayal flags of their votes (see senator_index_entries), written alongside
+    the store and read one senator at a time. """
+    VERSION = 1
+
+    def __init__(self, year):
+        self.path = "data/rollcalls/{}/{}".format(year, SENATOR_INDEX)
+        with open(self.path, 'rb') as f:
+            length, = struct.unpack('<Q', f.read(8))
+            self.version, self.fingerprint, self.segments, self.offsets = marshal.loads(f.read(length))
+        self.start = 8 + length
+
+    def senators(self):
+        return sorted(self.offsets)
+
+    def entries(self, lis):
+        """ The entries of a senator, empty if they did not vote in the year. """
+        if lis not in self.offsets:
+            return []
+        offset, length = self.offsets[lis]
+        with open(self.path, 'rb') as f:
+            f.seek(self.start + offset)
+            return marshal.loads(f.read(length))
+
+    def all_entries(self):
+        return dict((lis, self.entries(lis)) for lis in self.offsets)
+
+    def matches(self, aggregates):
+        return (self.version == self.VERSION and self.fingerprint == aggregates['fingerprint']
+                and self.segments == list(aggregates['segments']))
+
+    @classmethod
+    def load(cls, year):
+        """ The index of a year, rebuilt from the pickled roll calls if it is missing
+        or was not built from the current store. Raises StaleStoreError if the store
+        itself is out of date, as for count_betrayals_cached. """
+        aggregates = year_aggregates(year)
+        if os.path.exists("data/rollcalls/{}/{}".format(year, SENATOR_INDEX)):
+            index = cls(year)
+            if index.matches(aggregates):
+                return index
+        with Stage('senator-index', year):
+            entries = defaultdict(list)
+            for part, (pickle_path, columns_path) in enumerate(year_store_parts(year, aggregates['segments'])):
+                with open(pickle_path, 'rb') as f:
+                    senator_index_entries(pickle.load(f), part, entries)
+            save_senator_index(year, aggregates, entries)
+        return cls(year)
+
+@contextmanager
+def atomic_open(path):
+    """ Opens a temporary file next to path for binary writing and moves it over path
+    once it has been completely written, so that readers never see a partial file. """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                     prefix='.{}.'.format(os.path.basename(path)),
+                                     suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def require_numpy():
+    if numpy is None:
+        print 'This option requires the external numpy module. sudo pip install numpy'
+        sys.exit(1)
+
+""" Columns of the columnar roll call store, and the vocabulary each integer coded column indexes into. """
+ROLL_CALL_COLUMN_NAMES = ('roll_call_id', 'roll_call_requires', 'roll_call_resolution', 'roll_call_success', 'roll_call_offset')
+VOTE_COLUMN_NAMES = ('vote_senator', 'vote_party', 'vote_answer')
+COLUMN_VOCABULARIES = {
+    'roll_call_requires': 'requires',
+    'roll_call_resolution': 'resolution',
+    'vote_senator': 'senator',
+    'vote_party': 'party',
+}
+COLUMN_VOCABULARY_FILE = 'vocabulary.json'
+
+def encode_columns(roll_calls):
+    """ Encodes roll calls as (columns, vocabulary).
+
+    columns maps each name in ROLL_CALL_COLUMN_NAMES and VOTE_COLUMN_NAMES to a numpy
+    array. Roll call columns have one entry per roll call, except roll_call_offset, which
+    has one more: the votes of roll call i are entries roll_call_offset[i] up to
+    roll_call_offset[i + 1] of the vote columns. Success and vote answers are 1 for Y and
+    0 for N; the other columns are codes into the matching list of vocabulary.
+    """
+    vocabulary = dict((name, []) for name in COLUMN_VOCABULARIES.values())
+    codes = dict((name, {}) for name in COLUMN_VOCABULARIES.values())
+    def encode(name, value):
+        if value not in codes[name]:
+            codes[name][value] = len(vocabulary[name])
+            vocabulary[name].append(value)
+        return codes[name][value]
+
+    values = dict((name, []) for name in ROLL_CALL_COLUMN_NAMES + VOTE_COLUMN_NAMES)
+    values['roll_call_offset'].append(0)
+    for roll_call in roll_calls:
+        values['roll_call_id'].append(roll_call.roll_call_id)
+        values['roll_call_requires'].append(encode('requires', roll_call.requires))
+        values['roll_call_resolution'].append(encode('resolution', roll_call.resolution))
+        values['roll_call_success'].append(roll_call.success == 'Y')
+        for vote in roll_call.votes:
+            values['vote_senator'].append(encode('senator', vote.senator_id))
+            values['vote_party'].append(encode('party', vote.party))
+            values['vote_answer'].append(vote.vote_answer == 'Y')
+        values['roll_call_offset'].append(len(values['vote_answer']))
+
+    columns = {
+        'roll_call_id': numpy.array(values['roll_call_id'], dtype=str),
+        'roll_call_requires': numpy.array(values['roll_call_requires'], dtype=numpy.int16),
+        'roll_call_resolution': numpy.array(values['roll_call_resolution'], dtype=numpy.int16),
+        'roll_call_success': numpy.array(values['roll_call_success'], dtype=numpy.int8),
+        'roll_call_offset': numpy.array(values['roll_call_offset'], dtype=numpy.int64),
+        'vote_senator': numpy.array(values['vote_senator'], dtype=numpy.int32),
+        'vote_party': numpy.array(values['vote_party'], dtype=numpy.int16),
+        'vote_answer': numpy.array(values['vote_answer'], dtype=numpy.int8),
+    }
+    return columns, vocabulary
+
+def save_columns(path, roll_calls):
+    """ Writes roll calls in columnar form to the directory path, e.g. data/{year}/columns/ """
+    columns, vocabulary = encode_columns(roll_calls)
+    temp_path = tempfile.mkdtemp(dir=os.path.dirname(path), prefix='.{}.'.format(os.path.basename(path)), suffix='.tmp')
+    try:
+        for name, values in columns.items():
+            numpy.save(os.path.join(temp_path, '{}.npy'.format(name)), values)
+        with open(os.path.join(temp_path, COLUMN_VOCABULARY_FILE), 'wb') as f:
+            json.dump(vocabulary, f)
+        replace_directory(temp_path, path)
+    except:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+
+def replace_directory(source, destination):
+    """ Moves the directory source to destination, replacing whatever is there. """
+    if os.path.isdir(destination):
+        old_path = tempfile.mkdtemp(dir=os.path.dirname(destination), suffix='.old')
+        os.rename(destination, os.path.join(old_path, 'replaced'))
+        os.rename(source, destination)
+        shutil.rmtree(old_path)
+    else:
+        os.rename(source, destination)
+
+class ColumnStore(object):
+    """ Read only view of the columnar roll call data of a year (see encode_columns).
+
+    Each column is memory mapped the first time it is asked for, so the cost of
+    opening a store grows with the columns a report uses rather than with the
+    number of votes in it.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._columns = {}
+        self._vocabulary = None
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = numpy.load(os.path.join(self.path, '{}.npy'.format(name)), mmap_mode='r')
+        return self._columns[name]
+
+    @property
+    def vocabulary(self):
+        if self._vocabulary is None:
+            with open(os.path.join(self.path, COLUMN_VOCABULARY_FILE), 'rb') as f:
+                self._vocabulary = json.load(f)
+        return self._vocabulary
+
+    def decoded(self, name):
+        """ The values of an integer coded column, looked up in its vocabulary. """
+        words = self.vocabulary[COLUMN_VOCABULARIES[name]]
+        return [words[code] for code in self.column(name)]
+
+    def __len__(self):
+        return len(self.column('roll_call_id'))
+
+    def roll_calls(self):
+        """ Decodes the store back into RollCall objects. """
+        offsets = self.column('roll_call_offset')
+        senators = self.decoded('vote_senator')
+        parties = self.decoded('vote_party')
+        answers = ['Y' if answer else 'N' for answer in self.column('vote_answer')]
+        roll_calls = []
+        for i, (roll_call_id, requires, resolution) in enumerate(zip(self.column('roll_call_id'),
+                                                                     self.decoded('roll_call_requires'),
+                                                                     self.decoded('roll_call_resolution'))):
+            votes = [Vote(senators[j], parties[j], answers[j]) for j in xrange(offsets[i], offsets[i + 1])]
+            roll_call = RollCall.__new__(RollCall)
+            roll_call._build(str(roll_call_id), requires, votes, resolution)
+            roll_calls.append(roll_call)
+        return roll_calls
+
+""" Fields of the rows the export action writes for each roll call and each vote.
+Booleans are written as 1 and 0. """
+EXPORT_ROLL_CALL_FIELDS = ('year', 'roll_call_id', 'requires', 'resolution', 'success', 'yea_count', 'nay_count',
+                           'betrayal_cnt', 'futile_cnt', 'betrayal_necessary')
+EXPORT_VOTE_FIELDS = ('year', 'roll_call_id', 'senator', 'party', 'vote_answer', 'betrayed_party', 'futile_betrayal',
+                      'betrayal_necessary')
+
+def export_rows(year, roll_calls):
+    """ (roll call rows, vote rows) of the roll calls of a year, as lists of tuples
+    of EXPORT_ROLL_CALL_FIELDS and EXPORT_VOTE_FIELDS. """
+    year = int(year)
+    roll_call_rows = []
+    vote_rows = []
+    for roll_call in roll_calls:
+        necessary = int(roll_call.betrayal_necessary)
+        roll_call_rows.append((year, roll_call.roll_call_id, roll_call.requires, roll_call.resolution, roll_call.success,
+                               roll_call.yea_count, roll_call.nay_count, roll_call.betrayal_cnt, roll_call.futile_cnt,
+                               necessary))
+        for vote in roll_call.votes:
+            vote_rows.append((year, roll_call.roll_call_id, vote.senator_id, vote.party, vote.vote_answer,
+                              int(vote.betrayed_party), int(vote.futile_betrayal), necessary))
+    return roll_call_rows, vote_rows
+
+class CsvExport(object):
+    """ Writes roll_calls.csv and votes.csv into the directory path. """
+    def __init__(self, path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.files = [open(os.path.join(path, 'roll_calls.csv'), 'wb'), open(os.path.join(path, 'votes.csv'), 'wb')]
+        self.writers = [csv.writer(f) for f in self.files]
+        self.writers[0].writerow(EXPORT_ROLL_CALL_FIELDS)
+        self.writers[1].writerow(EXPORT_VOTE_FIELDS)
+
+    def add_year(self, year, roll_calls):
+        for writer, rows in zip(self.writers, export_rows(year, roll_calls)):
+            writer.writerows(rows)
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+class SqliteExport(object):
+    """ Writes the tables roll_calls and votes into a new SQLite database at path,
+    indexed on senator, year and roll_call_id once all the years are in. The
+    database is built next to path and moved over it when complete. """
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = '{}.tmp'.format(path)
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        self.connection = sqlite3.connect(self.temp_path)
+        self.connection.text_factory = str
+        self.connection.execute('CREATE TABLE roll_calls (year INTEGER, roll_call_id TEXT PRIMARY KEY, requires TEXT, '
+                                'resolution TEXT, success TEXT, yea_count INTEGER, nay_count INTEGER, '
+                                'betrayal_cnt INTEGER, futile_cnt INTEGER, betrayal_necessary INTEGER)')
+        self.connection.execute('CREATE TABLE votes (year INTEGER, roll_call_id TEXT, senator TEXT, party TEXT, '
+                                'vote_answer TEXT, betrayed_party INTEGER, futile_betrayal INTEGER, '
+                                'betrayal_necessary INTEGER)')
+
+    def add_year(self, year, roll_calls):
+        roll_call_rows, vote_rows = export_rows(year, roll_calls)
+        with self.connection:
+            self.connection.executemany('INSERT INTO roll_calls VALUES ({})'.format(
+                ', '.join('?' * len(EXPORT_ROLL_CALL_FIELDS))), roll_call_rows)
+            self.connection.executemany('INSERT INTO votes VALUES ({})'.format(
+                ', '.join('?' * len(EXPORT_VOTE_FIELDS))), vote_rows)
+
+    def close(self):
+        with self.connection:
+            self.connection.execute('CREATE INDEX roll_calls_year ON roll_calls (year)')
+            for field in ('senator', 'year', 'roll_call_id'):
+                self.connection.execute('CREATE INDEX votes_{0} ON votes ({0})'.format(field))
+        self.connection.close()
+        os.rename(self.temp_path, self.path)
+
+class ColumnsExport(object):
+    """ Writes the rows of each year as numpy arrays, one .npy file per field, in
+    path/{year}/roll_calls/ and path/{year}/votes/. Text fields are byte strings. """
+    def __init__(self, path):
+        require_numpy()
+        self.path = path
+
+    def add_year(self, year, roll_calls):
+        for name, fields, rows in zip(('roll_calls', 'votes'), (EXPORT_ROLL_CALL_FIELDS, EXPORT_VOTE_FIELDS),
+                                      export_rows(year, roll_calls)):
+            table_path = os.path.join(self.path, str(year), name)
+            if not os.path.isdir(table_path):
+                os.makedirs(table_path)
+            for field, values in zip(fields, zip(*rows) or [()] * len(fields)):
+                numpy.save(os.path.join(table_path, '{}.npy'.format(field)), numpy.array(values))
+
+    def close(self):
+        pass
+
+""" Formats of the export action. """
+EXPORTS = {
+    'csv': CsvExport,
+    'sqlite': SqliteExport,
+    'columns': ColumnsExport,
+}
+
+def export_years(years, export_format, path):
+    """ Exports the stored roll calls of the years to path, one year at a time so
+    that only a year of roll calls is in memory at once. """
+    export = EXPORTS[export_format](path)
+    for year in years:
+        with Stage('export', year) as stage:
+            roll_calls = load_roll_calls(year)
+            export.add_year(year, roll_calls)
+            stage.count = len(roll_calls)
+    export.close()
+
+def check_parsers(year):
+    """ Parses every roll call xml file of a year with each of the PARSERS
+    and prints any file for which they do not build identical roll calls. A file
+    whose result neither parser can classify is quarantined by both, which counts as
+    agreement; one quarantined by only one of them is a mismatch. """
+    mismatches = 0
+    checked = 0
+    for file_path in roll_call_paths(year):
+        signatures = set()
+        for parser in PARSERS.values():
+            with open(file_path, 'rb') as f:
+                try:
+                    signatures.add(roll_call_signature(parser(f)))
+                except UnknownResultError:
+                    signatures.add(None)
+        checked += 1
+        if len(signatures) > 1:
+            mismatches += 1
+            print 'Parsers disagree on {}'.format(file_path)
+    print '{}: {} roll calls checked, {} mismatches'.format(year, checked, mismatches)
+    return mismatches == 0
+
+def roll_call_signature(roll_call):
+    """ Everything a roll call computes, in a form that can be compared. """
+    return (roll_call.roll_call_id,
+            roll_call.requires,
+            roll_call.resolution,
+            roll_call.success,
+            tuple(sorted(roll_call.party_breakdown.items())),
+            (roll_call.yea_count, roll_call.nay_count, roll_call.betrayal_cnt, roll_call.futile_cnt, roll_call.betrayal_necessary),
+            tuple((vote.senator_id, vote.party, vote.vote_answer, vote.betrayed_party, vote.futile_betrayal)
+                  for vote in roll_call.votes))
 
 def year_iterator(args):
-    if '-' in args.years:
-        start, end = args.years.split('-')
+    return parse_years(args.years)
+
+def parse_years(years):
+    if '-' in years:
+        start, end = years.split('-')
         return xrange(int(start), int(end) + 1)
     else:
-        return args.years.split(',')
-    
+        return years.split(',')
+
+class ReportServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Answers calculate_betrayal queries over HTTP/JSON, each request in its own
+    thread, from the roll calls of a range of years loaded once and kept in memory.
+
+    GET /report takes the parameters of calculate_betrayal: years (any subset of the
+    served years, written as on the command line; all of them by default),
+    only_necessary, only_current, only_candidates, limit and sort. GET /years lists
+    the served years.
+
+    A year is loaded again on the first request after load-years or append-years
+    has saved it. Each year has its own lock, taken only to load it or count it for
+    the first time; while a year is being loaded again, other requests are answered
+    from its previous load.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, years):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ReportRequestHandler)
+        self.years = [int(year) for year in years]
+        self.locks = dict((year, threading.Lock()) for year in self.years)
+        self.loaded = {}
+        for year in self.years:
+            self.year_counts(year, False)
+
+    def year_counts(self, year, only_necessary):
+        """ count_betrayals of the roll calls of a year, memoized until the year is reloaded. """
+        saved = year_saved_time(year)
+        loaded = self.loaded.get(year)
+        counted = loaded is not None and only_necessary in loaded['counts']
+        if counted and loaded['saved'] == saved:
+            return loaded['counts'][only_necessary]
+        lock = self.locks[year]
+        if not lock.acquire(not counted):
+            # another request is loading the year again
+            return loaded['counts'][only_necessary]
+        try:
+            loaded = self.loaded.get(year)
+            if loaded is None or loaded['saved'] != saved:
+                loaded = {'saved': saved, 'roll_calls': load_roll_calls(year), 'counts': {}}
+            if only_necessary not in loaded['counts']:
+                loaded['counts'][only_necessary] = dict(count_betrayals(loaded['roll_calls'], only_necessary))
+            self.loaded[year] = loaded
+            return loaded['counts'][only_necessary]
+        finally:
+            lock.release()
+
+    def report(self, years = None, only_necessary = False, only_current = False, only_candidates = False, limit = 20, sort = 'pct'):
+        """ The rows calculate_betrayal would print, as dictionaries. """
+        years = years is None and self.years or [int(year) for year in years]
+        unknown = [year for year in years if year not in self.years]
+        if unknown:
+            raise ValueError('Not serving {}'.format(', '.join(str(year) for year in unknown)))
+        if sort not in SORT_KEYS:
+            raise ValueError('Unknown sort: {}'.format(sort))
+        counts = {}
+        for year in years:
+            add_counts(counts, self.year_counts(year, only_necessary))
+        return [{
+            'lis': senator.lis,
+            'senator': str(senator),
+            'current': senator.current,
+            'all': senator.vote_cnt,
+            'total': senator.total_betrayal_cnt,
+            'tot_pct': senator.total_betrayal_pct,
+            'success': senator.betrayal_cnt,
+            'fail': senator.futile_cnt,
+            'pct': senator.success_pct,
+        } for senator in ranked_senators(tally_senators(counts), only_current, only_candidates, limit, sort)]
+
+def year_saved_time(year):
+    """ When the store of a year was last saved; its aggregates are written last. """
+    for filename in (AGGREGATES_PICKLE, ROLL_CALLS_PICKLE):
+        path = "data/rollcalls/{}/{}".format(year, filename)
+        if os.path.exists(path):
+            return os.path.getmtime(path)
+    return None
+
+class ReportRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Request handler of the ReportServer. """
+    FLAGS = ('only_necessary', 'only_current', 'only_candidates')
+
+    def do_GET(self):
+        url = urlparse.urlsplit(self.path)
+        query = dict((name, values[-1]) for name, values in urlparse.parse_qs(url.query).items())
+        if url.path == '/years':
+            return self.send_json(200, {'years': self.server.years})
+        if url.path != '/report':
+            return self.send_json(404, {'error': 'Unknown path: {}'.format(url.path)})
+        try:
+            arguments = dict((flag, query.get(flag, '').lower() in ('1', 'true', 'yes')) for flag in self.FLAGS)
+            if 'years' in query:
+                arguments['years'] = parse_years(query['years'])
+            arguments['limit'] = int(query.get('limit', 20))
+            arguments['sort'] = query.get('sort', 'pct')
+            rows = self.server.report(**arguments)
+        except ValueError as e:
+            return self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            return self.send_json(500, {'error': '{}: {}'.format(type(e).__name__, e)})
+        self.send_json(200, {'senators': rows})
+
+    def send_json(self, status, data):
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def ready_years(years, load, parser = 'stream', jobs = 1, fetcher = None):
+    """ Brings the stores of the years up to date before they are reported on: years
+    never loaded are loaded with load (load_years or load_years_pipelined), and years
+    whose store is out of date with its files (see store_current) are rebuilt from
+    them with rebuild_year. Yields (year, roll_calls) of the years loaded. """
+    missing = [year for year in years if not os.path.exists("data/rollcalls/{}/{}".format(year, ROLL_CALLS_PICKLE))]
+    for year in years:
+        if year not in missing and not store_current(year):
+            rebuild_year(year, parser, jobs)
+    for year, roll_calls in load(missing, parser, jobs, fetcher):
+        yield year, roll_calls
 
 def run(args):
+    fetcher = Fetcher(args.fetch_jobs, args.rate, base_url=args.senate_url, legislators_url=args.legislators_url)
+    load = args.pipeline and load_years_pipelined or load_years
     if args.action == 'load-senators':
-        load_senators(True)
+        load_senators(True, fetcher)
     elif args.action == 'load-years':
+        for year, roll_calls in load(year_iterator(args), args.parser, args.jobs, fetcher):
+            print 'Loaded:', year
+    elif args.action == 'append-years':
         for year in year_iterator(args):
-            print 'Loading:', year
-            load_year(year)
+            roll_calls = append_year(year, args.parser, args.jobs, fetcher)
+            print 'Appended: {} ({} roll calls)'.format(year, len(roll_calls))
+    elif args.action == 'serve':
+        years = list(year_iterator(args))
+        for year, roll_calls in ready_years(years, load, args.parser, args.jobs, fetcher):
+            pass
+        server = ReportServer((args.host, args.port), years)
+        print 'Serving reports on {} at http://{}:{}/report'.format(args.years, args.host, args.port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    elif args.action == 'export':
+        if args.format not in EXPORTS or not args.output:
+            print 'export needs --output and a --format of {}'.format(', '.join(sorted(EXPORTS)))
+            sys.exit(1)
+        years = list(year_iterator(args))
+        for year, roll_calls in ready_years(years, load, args.parser, args.jobs, fetcher):
+            pass
+        export_years(years, args.format, args.output)
+    elif args.action in ('verify', 'rebuild'):
+        if not verify_years(year_iterator(args), args.action == 'rebuild', args.parser, args.jobs):
+            sys.exit(1)
+    elif args.action == 'classification':
+        years = list(year_iterator(args))
+        for year, roll_calls in ready_years(years, load, args.parser, args.jobs, fetcher):
+            pass
+        classification_report(years)
+    elif args.action == 'check-parsers':
+        results = [check_parsers(year) for year in year_iterator(args)]
+        if not all(results):
+            sys.exit(1)
     else:
-        vm = RollCallManager()
-        for year in year_iterator(args):
-            if os.path.exists("data/rollcalls/{}/{}".format(year, ROLL_CALLS_PICKLE)):
-                with open("data/rollcalls/{}/{}".format(year, ROLL_CALLS_PICKLE), 'rb') as f:
-                    roll_calls = pickle.load(f)
+        years = list(year_iterator(args))
+        vm = RollCallManager(years)
+        checking = args.action == 'check-engines'
+        columns_only = args.action in ('agreement', 'simulate', 'bootstrap')
+        hists = args.action in ('resolution-hist', 'betrayal-hist')
+        if args.stream and args.action not in ('calculate', 'resolution-hist', 'betrayal-hist'):
+            print '--stream works with calculate, resolution-hist and betrayal-hist'
+            sys.exit(1)
+        if args.stream and args.action == 'calculate' and args.engine not in ('objects', 'cached', 'indexed'):
+            print '--stream works with the objects, cached and indexed engines'
+            sys.exit(1)
+        if args.stream:
+            for year, roll_calls in ready_years(years, load, args.parser, args.jobs, fetcher):
+                pass
+            loaded = {}
+            vm.roll_calls = StreamedRollCalls(years, args.storage)
+        else:
+            loaded = dict(ready_years(years, load, args.parser, args.jobs, fetcher))
+        if args.action == 'time-series':
+            if args.window < 1 or args.step < 1:
+                print '--window and --step must be at least 1'
+                sys.exit(1)
+            if args.format not in ('csv', 'json'):
+                print 'time-series writes csv or json'
+                sys.exit(1)
+            rows = time_series_rows(years, args.window, args.step, args.only_necessary, args.only_current, args.only_pc)
+            if args.output:
+                with atomic_open(args.output) as f:
+                    write_time_series(rows, f, args.format)
             else:
-                roll_calls = load_year(year)
+                write_time_series(rows, sys.stdout, args.format)
+            return
+        senators = None
+        if args.action == 'calculate':
+            senators = report_senators(args.senator and args.senator.split(','), args.only_current, args.only_pc)
+        for year in years:
+            if senators is not None or args.stream:
+                continue
+            if args.storage == 'columns' or args.engine == 'vectorized' or checking or columns_only:
+                stores = vm.load_columns(year)
+            if (args.engine in ('cached', 'vectorized', 'indexed') or columns_only) and not (checking or hists):
+                continue
+            if year in loaded:
+                roll_calls = loaded.pop(year)
+            elif args.storage == 'columns':
+                roll_calls = [roll_call for store in stores for roll_call in store.roll_calls()]
+            else:
+                roll_calls = load_roll_calls(year)
             vm.roll_calls.extend(roll_calls)
-        calculate_betrayal(vm, args.only_necessary, args.only_current, args.only_pc, args.limit, args.sort)
+        if checking:
+            if not check_engines(vm):
+                sys.exit(1)
+        elif args.action == 'resolution-hist':
+            resolution_hist(vm)
+        elif args.action == 'betrayal-hist':
+            betrayal_hist(vm)
+        elif args.action == 'simulate':
+            simulate(vm, args.only_current, args.only_pc, args.limit, args.senator and args.senator.split(',') or ())
+        elif args.action == 'bootstrap':
+            calculate_bootstrap(vm, args.only_necessary, args.only_current, args.only_pc, args.limit, args.sort,
+                                args.replicates, args.confidence, args.seed, args.jobs)
+        elif args.action == 'agreement':
+            calculate_agreement(vm, args.only_necessary, args.only_current, args.only_pc, args.top, args.min_shared, args.output)
+        else:
+            calculate_betrayal(vm, args.only_necessary, args.only_current, args.only_pc, args.limit, args.sort, args.engine, senators)
 
 if __name__ == '__main__':
     parser = ArgumentParser(description='Write out data about senators\' votes in opposition to the majority of their parties')
     parser.add_argument('years', type=str, help='csv (e.g. "1991,1992,1993" with no space) or simple range (e.g. "1991-2015") of years to parse')
-    parser.add_argument('--action', type=str, default='calculate', help='Action to take: calculate, load-senators, load-year')
+    parser.add_argument('--action', type=str, default='calculate', help='Action to take: calculate, bootstrap, agreement, time-series, simulate, export, classification, load-senators, verify, rebuild, load-years, append-years, serve, check-parsers, check-engines, resolution-hist, betrayal-hist')
     parser.add_argument('--only-current', action='store_true', help='only show current senators')
     parser.add_argument('--only-necessary', action='store_true', help='limit betrayals to necessary ones')
     parser.add_argument('--limit', type=int, default=20, help='Number of senators to give data for')
     parser.add_argument('--only-pc', action='store_true', help='only show presidential candidates')
     parser.add_argument('--sort', type=str, default='pct', help='column to sort by: all, total, success, fail, pct')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes used to parse roll calls')
+    parser.add_argument('--stream', action='store_true', help='read one year of roll calls at a time instead of holding every year in memory (calculate, resolution-hist and betrayal-hist)')
+    parser.add_argument('--pipeline', action='store_true', help='parse and save roll calls while the rest are still downloading, instead of downloading every year first')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='address the serve action listens on')
+    parser.add_argument('--port', type=int, default=8080, help='port the serve action listens on')
+    parser.add_argument('--fetch-jobs', type=int, default=4, help='number of files to download at once')
+    parser.add_argument('--rate', type=float, default=1.5, help='most download requests to start per second; 0 for no limit')
+    parser.add_argument('--senate-url', type=str, default=SENATE_URL, help='where to download senate.gov roll call files from, e.g. a mirror')
+    parser.add_argument('--legislators-url', type=str, default=LEGISLATORS_URL, help='where to download the congress-legislators yaml files from, e.g. a mirror')
+    parser.add_argument('--engine', type=str, default='objects', choices=sorted(BETRAYAL_ENGINES), help='how to count betrayals: objects (walks RollCall objects), vectorized (array operations on the columnar store, requires numpy), cached (sums cached per year aggregates) or indexed (reads the per senator index of each year)')
+    parser.add_argument('--storage', type=str, default='pickle', choices=('pickle', 'columns'), help='roll call store to read: pickle or columns (requires numpy)')
+    parser.add_argument('--parser', type=str, default='stream', choices=sorted(PARSERS), help='roll call xml parser: stream (incremental) or dom (legacy minidom)')
+    parser.add_argument('--replicates', type=int, default=1000, help='bootstrap: number of resamples of the roll calls')
+    parser.add_argument('--confidence', type=float, default=0.95, help='bootstrap: coverage of the percentile intervals')
+    parser.add_argument('--seed', type=int, default=0, help='bootstrap: random seed; results do not depend on --jobs')
+    parser.add_argument('--senator', type=str, help='csv of lis ids: calculate only counts the votes of these senators; simulate lists the roll calls they would have flipped')
+    parser.add_argument('--top', type=int, default=5, help='agreement: number of most and least aligned senators to list for each senator')
+    parser.add_argument('--min-shared', type=int, default=20, help='agreement: fewest roll calls two senators must have voted in together to be listed')
+    parser.add_argument('--window', type=int, default=2, help='time-series: years in each window, e.g. 2 for a congress or 6 for a term')
+    parser.add_argument('--step', type=int, default=1, help='time-series: years between the starts of consecutive windows')
+    parser.add_argument('--format', type=str, default='csv', choices=('csv', 'json', 'sqlite', 'columns'), help='output format: csv or json for time-series; csv, sqlite or columns for export')
+    parser.add_argument('--output', type=str, help='file to write to: the agreement matrix csv, the time-series rows instead of stdout, or the export (a directory for csv and columns)')
+    parser.add_argument('--timings', action='store_true', help='print the wall time, CPU time, peak memory and item count of each stage to stderr')
+    parser.add_argument('--profile', type=str, help='file to write cProfile statistics of the run to, for python -m pstats')
     args = parser.parse_args()
-    run(args)
+    if args.timings:
+        timings = StageTimings()
+        STAGE_HOOKS.append(timings)
+    profiler = args.profile and cProfile.Profile()
+    try:
+        if profiler:
+            profiler.runcall(run, args)
+        else:
+            run(args)
+    finally:
+        if profiler:
+            profiler.dump_stats(args.profile)
+        if args.timings:
+            timings.report()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+""" Parity tests for calculate.py on synthetic Senate data (see benchmark.generate_senate),
+downloaded from a stand-in for senate.gov where a test needs the network.
+
+Run with: python -m unittest test_calculate
+"""
+import BaseHTTPServer
+import hashlib
+import httplib
+import os
+import shutil
+import socket
+import SocketServer
+import tempfile
+import threading
+import time
+import unittest
+
+import benchmark
+import calculate
+
+YEARS = range(benchmark.FIRST_YEAR, benchmark.FIRST_YEAR + 3)
+VOTES_PER_YEAR = 30
+
+class SyntheticSenateTest(unittest.TestCase):
+    """ Generates and loads a few synthetic years once, in a scratch directory. """
+    @classmethod
+    def setUpClass(cls):
+        cls.original_path = os.getcwd()
+        cls.work_path = tempfile.mkdtemp(prefix='senate-test-')
+        benchmark.generate_senate(cls.work_path, YEARS, VOTES_PER_YEAR)
+        os.chdir(cls.work_path)
+        calculate.load_senators(False)
+        cls.loaded = dict(calculate.load_years(YEARS))
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.original_path)
+        shutil.rmtree(cls.work_path)
+
+    def test_loaded(self):
+        self.assertEqual([len(self.loaded[year]) for year in YEARS], [VOTES_PER_YEAR] * len(YEARS))
+
+    def test_check_parsers(self):
+        for year in YEARS:
+            self.assertTrue(calculate.check_parsers(year))
+
+    @unittest.skipIf(calculate.numpy is None, 'the vectorized engine requires numpy')
+    def test_check_engines(self):
+        vm = calculate.RollCallManager(YEARS)
+        for year in YEARS:
+            vm.load_columns(year)
+            vm.roll_calls.extend(calculate.load_roll_calls(year))
+        self.assertTrue(calculate.check_engines(vm))
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Serves files over HTTP on a free local port, in a thread of its own, with an
+    ETag on every response. files maps each request path to the local file it serves;
+    any other path, or a missing file, gets a 404. scripts maps a request path to a list
+    of functions, each answering one request to the path (given the handler) before
+    the file is served normally. requests lists the path and headers of each request. """
+    daemon_threads = True
+
+    def __init__(self, files = None):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StandInHandler)
+        self.files = files or {}
+        self.scripts = {}
+        self.requests = []
+        self.connections = set()
+        self.url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def process_request(self, request, client_address):
+        self.connections.add(request)
+        SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+
+    def shutdown_request(self, request):
+        self.connections.discard(request)
+        BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+    def stop(self):
+        """ Stops serving, and ends the connections clients have kept open. """
+        self.shutdown()
+        self.server_close()
+        for request in list(self.connections):
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        script = self.server.scripts.get(self.path)
+        if script:
+            return script.pop(0)(self)
+        path = self.server.files.get(self.path)
+        if path is None or not os.path.exists(path):
+            return self.reply(404, 'Not found')
+        with open(path, 'rb') as f:
+            body = f.read()
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            return self.reply(304, '', {'ETag': etag})
+        self.reply(200, body, {'ETag': etag})
+
+    def reply(self, status, body, headers = {}):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def drop(self, length, body):
+        """ Promises length bytes, sends only body and closes the connection. """
+        self.send_response(200)
+        self.send_header('Content-Length', str(length))
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = True
+
+def senate_files(root, years):
+    """ The StandInServer files serving the menus and roll calls of the years generated
+    in root at the paths calculate downloads them from. """
+    files = {}
+    for year in years:
+        session, subsession = calculate.calculate_session(year)
+        year_path = os.path.join(root, 'data', 'rollcalls', str(year))
+        files[calculate.MENU_URL.format(base='', session=session, subsession=subsession)] = os.path.join(year_path, 'menu.xml')
+        for filename in os.listdir(year_path):
+            if filename != 'menu.xml':
+                vote_number = filename[:-len('.xml')]
+                url = calculate.VOTE_URL.format(base='', session=session, subsession=subsession, vote_number=vote_number)
+                files[url] = os.path.join(year_path, filename)
+    return files
+
+class PipelineTest(unittest.TestCase):
+    """ load_years_pipelined against load_years, downloading from a StandInServer. """
+    @classmethod
+    def setUpClass(cls):
+        cls.original_path = os.getcwd()
+        cls.source_path = tempfile.mkdtemp(prefix='senate-test-source-')
+        benchmark.generate_senate(cls.source_path, YEARS, VOTES_PER_YEAR)
+        cls.server = StandInServer(senate_files(cls.source_path, YEARS))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        shutil.rmtree(cls.source_path)
+
+    def setUp(self):
+        self.work_path = tempfile.mkdtemp(prefix='senate-test-')
+        os.chdir(self.work_path)
+
+    def tearDown(self):
+        self.server.scripts.clear()
+        os.chdir(self.original_path)
+        shutil.rmtree(self.work_path)
+
+    def stores(self, load, jobs):
+        """ Loads the years into a fresh directory with load, and returns their stores
+        as roll call signatures and aggregates. """
+        path = tempfile.mkdtemp(dir=self.work_path)
+        os.chdir(path)
+        fetcher = calculate.Fetcher(rate=0, retries=0, base_url=self.server.url)
+        loaded = [year for year, roll_calls in load(YEARS, jobs=jobs, fetcher=fetcher)]
+        self.assertEqual(loaded, YEARS)
+        stores = dict((year, ([calculate.roll_call_signature(roll_call) for roll_call in calculate.load_roll_calls(year)],
+                              calculate.read_aggregates(year)['all']))
+                      for year in YEARS)
+        os.chdir(self.work_path)
+        return stores
+
+    def test_same_stores(self):
+        expected = self.stores(calculate.load_years, 1)
+        self.assertEqual([len(expected[year][0]) for year in YEARS], [VOTES_PER_YEAR] * len(YEARS))
+        self.assertEqual(self.stores(calculate.load_years_pipelined, 1), expected)
+        self.assertEqual(self.stores(calculate.load_years_pipelined, 2), expected)
+
+    def test_missing_file_stops_load(self):
+        session, subsession = calculate.calculate_session(YEARS[1])
+        missing = calculate.VOTE_URL.format(base='', session=session, subsession=subsession, vote_number='00007')
+        self.server.scripts[missing] = [lambda handler: handler.reply(404, 'Not found')]
+        fetcher = calculate.Fetcher(rate=0, retries=0, base_url=self.server.url)
+        with self.assertRaises(calculate.FetchError):
+            for year, roll_calls in calculate.load_years_pipelined(YEARS, fetcher=fetcher):
+                pass
+        self.assertIn(missing, [path for path, headers in self.server.requests])
+        self.assertFalse(os.path.exists('data/rollcalls/{}/{}'.format(YEARS[1], calculate.ROLL_CALLS_PICKLE)))
+
+class FetcherTest(unittest.TestCase):
+    """ Fetcher against a StandInServer that misbehaves as asked. """
+    def setUp(self):
+        self.original_path = os.getcwd()
+        self.work_path = tempfile.mkdtemp(prefix='senate-test-')
+        os.chdir(self.work_path)
+        with open('served.xml', 'wb') as f:
+            f.write('<vote>served</vote>')
+        self.server = StandInServer({'/served.xml': os.path.join(self.work_path, 'served.xml')})
+        self.fetcher = calculate.Fetcher(rate=0, retries=1, base_url=self.server.url)
+        self.waits = []
+        calculate.sleep = self.waits.append
+
+    def tearDown(self):
+        calculate.sleep = time.sleep
+        self.server.stop()
+        os.chdir(self.original_path)
+        shutil.rmtree(self.work_path)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_dropped_connection(self):
+        self.server.scripts['/served.xml'] = [lambda handler: handler.drop(100, '<vote>'),
+                                              lambda handler: handler.drop(100, '<vote>')]
+        with self.assertRaises(httplib.IncompleteRead):
+            self.fetcher.fetch(self.server.url + '/served.xml', 'fetched.xml')
+        self.assertEqual(sorted(os.listdir('.')), ['served.xml'])
+
+        self.server.scripts['/served.xml'] = [lambda handler: handler.drop(100, '<vote>')]
+        self.assertTrue(self.fetcher.fetch(self.server.url + '/served.xml', 'fetched.xml'))
+        self.assertEqual(self.read('fetched.xml'), '<vote>served</vote>')
+        self.assertEqual(sorted(os.listdir('.')), ['fetched.xml', 'served.xml'])
+
+    def test_retry_after(self):
+        self.server.scripts['/served.xml'] = [lambda handler: handler.reply(503, 'Busy', {'Retry-After': '7'})]
+        self.assertTrue(self.fetcher.fetch(self.server.url + '/served.xml', 'fetched.xml'))
+        self.assertEqual(self.read('fetched.xml'), '<vote>served</vote>')
+        self.assertEqual(self.waits, [7.0])
+
+        self.server.scripts['/served.xml'] = [lambda handler: handler.reply(503, 'Busy')] * 2
+        with self.assertRaises(calculate.FetchError):
+            self.fetcher.fetch(self.server.url + '/served.xml', 'fetched.xml')
+        self.assertEqual(self.waits, [7.0, self.fetcher.backoff])
+
+    def test_conditional_menu(self):
+        year = benchmark.FIRST_YEAR
+        session, subsession = calculate.calculate_session(year)
+        menu_url = calculate.MENU_URL.format(base='', session=session, subsession=subsession)
+        self.server.files[menu_url] = os.path.join(self.work_path, 'menu.xml')
+        with open('menu.xml', 'wb') as f:
+            f.write('<vote_summary><votes></votes></vote_summary>')
+        menu_path = 'data/rollcalls/{}/menu.xml'.format(year)
+
+        self.assertEqual(calculate.download_year(year, self.fetcher, refresh=True), [])
+        self.assertTrue(os.path.exists('{}.headers'.format(menu_path)))
+        self.assertEqual(calculate.download_year(year, self.fetcher, refresh=True), [])
+        self.assertIn('If-None-Match', [name.title() for name in self.server.requests[-1][1]])
+        self.assertEqual(self.read(menu_path), self.read('menu.xml'))
+
+        with open('menu.xml', 'wb') as f:
+            f.write('<vote_summary><votes><vote><vote_number>00001</vote_number></vote></votes></vote_summary>')
+        self.server.files[calculate.VOTE_URL.format(base='', session=session, subsession=subsession, vote_number='00001')] = \
+            os.path.join(self.work_path, 'served.xml')
+        self.assertEqual(calculate.download_year(year, self.fetcher, refresh=True), ['00001'])
+        self.assertEqual(self.read(menu_path), self.read('menu.xml'))
+        self.assertEqual(self.read('data/rollcalls/{}/00001.xml'.format(year)), '<vote>served</vote>')
+
+    def test_redirects(self):
+        self.server.scripts['/moved.xml'] = [lambda handler: handler.reply(301, '', {'Location': '/found.xml'})]
+        self.server.scripts['/found.xml'] = [lambda handler: handler.reply(302, '', {'Location': self.server.url + '/served.xml'})]
+        self.assertTrue(self.fetcher.fetch(self.server.url + '/moved.xml', 'fetched.xml'))
+        self.assertEqual(self.read('fetched.xml'), '<vote>served</vote>')
+        self.assertEqual([path for path, headers in self.server.requests], ['/moved.xml', '/found.xml', '/served.xml'])
+
+        self.server.scripts['/loop.xml'] = [lambda handler: handler.reply(302, '', {'Location': '/loop.xml'})] * 10
+        with self.assertRaises(calculate.FetchError):
+            self.fetcher.fetch(self.server.url + '/loop.xml', 'loop.xml')
+        self.assertFalse(os.path.exists('loop.xml'))
+
+    def test_legislators_url(self):
+        benchmark.generate_senate('source', YEARS[:1], 1)
+        self.server.files = dict(('/mirror/{}'.format(filename), os.path.join(self.work_path, 'source', 'data', 'legislators', filename))
+                                 for filename in ('legislators-current.yaml', 'legislators-historical.yaml'))
+        fetcher = calculate.Fetcher(rate=0, retries=0, legislators_url=self.server.url + '/mirror/')
+        calculate.load_senators(True, fetcher)
+        self.assertTrue(os.path.exists('data/legislators/{}'.format(calculate.LEGISLATORS_PICKLE)))
+        self.assertEqual(sorted(path for path, headers in self.server.requests),
+                         ['/mirror/legislators-current.yaml', '/mirror/legislators-historical.yaml'])
+
+if __name__ == '__main__':
+    unittest.main()